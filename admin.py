@@ -1,74 +1,121 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta
 
+from web import follow_spot_changes, watch_changes
 
-def render_analytics_page(spots_df, reservations_df):
-    st.header("📊 Analytics Dashboard")
 
-    total_spots = len(spots_df)
-    reserved_spots = len(spots_df[spots_df['status'] == 'reserved'])
-    available_spots = len(spots_df[spots_df['status'] == 'available'])
+HISTORY_PAGE_SIZE = 50
 
-    col1, col2, col3 = st.columns(3)
-    col1.metric("🅿️ Total Spots", total_spots)
-    col2.metric("🟡 Reserved", reserved_spots)
-    col3.metric("🟢 Available", available_spots)
 
-    st.markdown("---")
-    st.subheader("📋 Reservation History")
-    st.dataframe(reservations_df.sort_values("created_at", ascending=False))
+def render_keyset_page(key, filters, fetch):
+    """Show one page from ``fetch(cursor) -> (frame, next_cursor)`` with Prev/Next buttons.
 
+    The stack of cursors lives in session_state under ``key`` and starts over
+    whenever ``filters`` change, so each view only ever fetches one page.
+    """
+    state = st.session_state.setdefault(key, {"filters": None, "cursors": [None]})
+    if state["filters"] != filters:
+        state["filters"] = filters
+        state["cursors"] = [None]
 
-def render_system_settings_page(db):
-    st.header("🔧 System Settings")
+    page_df, next_cursor = fetch(state["cursors"][-1])
+    if page_df.empty:
+        st.info("No rows match the current filters.")
+    else:
+        st.dataframe(page_df, hide_index=True, use_container_width=True)
 
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns([1, 1, 4])
+    if col1.button("⬅️ Previous", key=f"{key}_prev", disabled=len(state["cursors"]) == 1):
+        state["cursors"].pop()
+        st.rerun()
+    if col2.button("Next ➡️", key=f"{key}_next", disabled=next_cursor is None):
+        state["cursors"].append(next_cursor)
+        st.rerun()
+    col3.caption(f"Page {len(state['cursors'])}")
+
+
+def render_reservation_history(db):
+    col1, col2, col3, col4 = st.columns(4)
+    plate = col1.text_input("Plate").strip().upper()
+    spot_id = col2.text_input("Spot").strip().upper()
+    status = col3.selectbox("Status", ["", "active", "expired"], format_func=lambda s: s or "Any")
+    dates = col4.date_input("Created between", value=())
+
+    start = end = None
+    if len(dates) == 2:
+        start = datetime.combine(dates[0], datetime.min.time())
+        end = datetime.combine(dates[1], datetime.max.time())
+
+    render_keyset_page(
+        "history_pager", (plate, spot_id, status, start, end),
+        lambda cursor: db.query_reservations(plate=plate or None, spot_id=spot_id or None,
+                                             status=status or None, start=start, end=end,
+                                             after=cursor, limit=HISTORY_PAGE_SIZE)
+    )
 
-    with col1:
-        if st.button("🔄 Reset Parking Spots"):
-            db.initialize_parking_spots()
-            st.success("Parking spots have been reset.")
-            st.rerun()
 
-    with col2:
-        if st.button("🧹 Clear Reservation History"):
-            empty_df = pd.DataFrame(columns=[
-                'id', 'spot_id', 'plate_number', 'customer_name', 'customer_email',
-                'customer_phone', 'start_time', 'end_time', 'duration_minutes',
-                'status', 'created_at'
-            ])
-            empty_df.to_csv(db.reservations_file, index=False)
-            st.success("Reservation history cleared.")
-            st.rerun()
+def render_analytics_page(db):
+    st.header("📊 Analytics Dashboard")
+
+    # Current counts come from the zone_status rollup, not a scan of every spot
+    status_df = pd.DataFrame(db.rollups.status_counts(), columns=['lot', 'zone', 'status', 'spots'])
+    totals = status_df.groupby('status')['spots'].sum()
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("🅿️ Total Spots", int(totals.sum()))
+    col2.metric("🟡 Reserved", int(totals.get('reserved', 0)))
+    col3.metric("🟢 Available", int(totals.get('available', 0)))
+
+    if not status_df.empty:
+        st.bar_chart(status_df.pivot_table(index='zone', columns='status', values='spots', aggfunc='sum'))
+
+    since = datetime.now() - timedelta(days=1)
+    occupancy = pd.DataFrame(db.rollups.hourly("occupancy", since))
+    if not occupancy.empty:
+        st.subheader("🚗 Peak Spots In Use (last 24h)")
+        st.line_chart(occupancy.pivot_table(index='hour', columns='zone', values='peak_in_use', aggfunc='sum'))
+
+    st.markdown("---")
+    st.subheader("📋 Reservation History")
+    render_reservation_history(db)
+
 
 def render_user_admin_panel():
 
-    from user import UserDatabase
+    from user import get_user_database
     st.subheader("👥 User Accounts")
 
-    db = UserDatabase()
-    users_df = db.load_users()
-    st.dataframe(users_df)
+    db = get_user_database()
+    prefix = st.text_input("🔎 Username starts with").strip()
+    render_keyset_page("users_pager", prefix,
+                       lambda cursor: db.query_users(prefix=prefix or None, after=cursor,
+                                                     limit=HISTORY_PAGE_SIZE))
 
     if st.button("🔄 Refresh User List"):
         st.rerun()
 def render_user_passwords_view():
-    from user import UserDatabase
+    from user import get_user_database
     st.subheader("🔑 View User Passwords")
 
     master_key = st.text_input("Enter admin password to reveal users' passwords", type="password")
     if master_key == "papitxo":
-        db = UserDatabase()
-        df = db.load_users()
+        db = get_user_database()
         st.success("Access granted. Below are stored user passwords.")
-        st.dataframe(df[['username', 'password_hash']].rename(columns={"password_hash": "password"}))
+
+        def fetch(cursor):
+            df, next_cursor = db.query_users(after=cursor, limit=HISTORY_PAGE_SIZE)
+            return df[['username', 'password_hash']].rename(columns={"password_hash": "password"}), next_cursor
+
+        render_keyset_page("passwords_pager", None, fetch)
     else:
         st.info("🔒 Access locked. Enter correct admin key to continue.")
 
 
-import plotly.express as px
-
 def render_system_settings_page(db):
+    import plotly.express as px
+
     st.header("🔧 System Settings")
 
     col1, col2 = st.columns(2)
@@ -81,145 +128,246 @@ def render_system_settings_page(db):
 
     with col2:
         if st.button("🧹 Clear Reservation History"):
-            empty_df = pd.DataFrame(columns=[
-                'id', 'spot_id', 'plate_number', 'customer_name', 'customer_email',
-                'customer_phone', 'start_time', 'end_time', 'duration_minutes',
-                'status', 'created_at'
-            ])
-            empty_df.to_csv(db.reservations_file, index=False)
+            db.clear_reservations()
             st.success("Reservation history cleared.")
             st.rerun()
 
-    # 🔄 Live data for chart
-    spots_df = db.get_parking_spots()
-    status_counts = spots_df['status'].value_counts().reset_index()
-    status_counts.columns = ['status', 'count']
+    # 🔄 Live data for chart, from the incrementally maintained rollups
+    status_counts = pd.DataFrame(db.rollups.status_counts(), columns=['lot', 'zone', 'status', 'spots'])
+    status_counts = status_counts.groupby('status', as_index=False)['spots'].sum()
 
-    fig = px.pie(status_counts, values='count', names='status', title="Current Spot Status Distribution")
+    fig = px.pie(status_counts, values='spots', names='status', title="Current Spot Status Distribution")
     st.plotly_chart(fig, use_container_width=True)
     st.markdown("---")
     st.subheader("📈 Reservation Time Distribution")
 
-    history_df = db.get_reservations_history()
+    days = st.selectbox("Window", [1, 7, 30, 90], index=1, format_func=lambda d: f"Last {d} days")
+    since = datetime.now() - timedelta(days=days)
+    hourly = pd.DataFrame(db.rollups.hourly("reservations", since))
+    durations = pd.DataFrame(db.rollups.duration_histogram(), columns=['lot', 'bucket', 'reservations'])
 
-    if not history_df.empty:
-        # Ensure datetime format
-        history_df['start_time'] = pd.to_datetime(history_df['start_time'])
-        history_df['end_time'] = pd.to_datetime(history_df['end_time'])
+    if not hourly.empty:
+        per_hour = hourly.groupby('hour', as_index=False)[['reservations', 'reserved_minutes']].sum()
+        per_hour['hour'] = pd.to_datetime(per_hour['hour'])
+        per_hour['avg_duration'] = per_hour['reserved_minutes'] / per_hour['reservations']
 
-        fig2 = px.scatter(
-            history_df,
-            x="start_time",
-            y="duration_minutes",
-            color="status",
-            hover_data=["plate_number", "spot_id"],
-            title="Reservation Durations Over Time"
-        )
-        fig2.update_layout(xaxis_title="Start Time", yaxis_title="Duration (minutes)")
+        fig2 = px.bar(per_hour, x="hour", y="reservations", hover_data=["avg_duration"],
+                      title="Reservations per Hour")
+        fig2.update_layout(xaxis_title="Start Time", yaxis_title="Reservations")
         st.plotly_chart(fig2, use_container_width=True)
     else:
         st.info("No reservation data available yet.")
 
+    if not durations.empty:
+        durations = durations.groupby('bucket', as_index=False)['reservations'].sum()
+        # Buckets are "<= N" labels plus one overflow bucket; order by their minutes
+        durations['order'] = durations['bucket'].str.extract(r'(\d+)', expand=False).astype(int)
+        durations.loc[durations['bucket'].str.startswith('>'), 'order'] += 1
+        fig3 = px.bar(durations.sort_values('order'), x='bucket', y='reservations',
+                      title="Reservation Durations (minutes)")
+        st.plotly_chart(fig3, use_container_width=True)
+
+    detections = pd.DataFrame(db.rollups.hourly("detections", since))
+    if not detections.empty:
+        st.subheader("📷 ANPR Detections")
+        st.bar_chart(detections.pivot_table(index='hour', columns='camera_location',
+                                            values='detections', aggfunc='sum'))
+
+    st.subheader("🔎 Plate Sightings")
+    plate = st.text_input("Plate number", key="sightings_plate")
+    if plate:
+        sightings = pd.DataFrame(db.plate_sightings(plate, limit=200))
+        if sightings.empty:
+            st.info(f"No detections of {plate.replace(' ', '').upper()} in the detection log.")
+        else:
+            col1, col2 = st.columns(2)
+            col1.metric("Last seen", sightings['detection_time'].iloc[0])
+            col2.metric("Sightings shown", len(sightings))
+            st.dataframe(sightings[['detection_time', 'camera_location', 'confidence', 'is_emergency']],
+                         use_container_width=True, hide_index=True)
+    stats = db.detections.stats()
+    st.caption(f"Detection log: {stats['rows']:,} rows in {stats['segments']} compressed segments "
+               f"({stats['compressed_bytes'] / 1e6:.1f} MB), oldest {stats['oldest'] or 'n/a'}")
+
+
+SPOT_STATUSES = ["available", "reserved", "occupied", "maintenance"]
+STATUS_COLORS = {
+    "available": "green",
+    "reserved": "orange",
+    "occupied": "red",
+    "maintenance": "gray"
+}
+SPOTS_PER_PAGE = 50
+
+
+def build_spot_grid(spots_df):
+    """Status codes and spot ids laid out as [y, x] arrays from the layout coordinates.
+
+    Cells without a spot are NaN / empty, so the whole level renders as a
+    single heatmap trace however many spots it has.
+    """
+    xs = spots_df['x'].to_numpy(dtype=int)
+    ys = spots_df['y'].to_numpy(dtype=int)
+    x0, y0 = xs.min(), ys.min()
+    shape = (ys.max() - y0 + 1, xs.max() - x0 + 1)
+
+    codes = pd.Categorical(spots_df['status'].str.strip().str.lower(), categories=SPOT_STATUSES).codes
+    z = np.full(shape, np.nan)
+    z[ys - y0, xs - x0] = np.where(codes >= 0, codes, np.nan)
+    labels = np.full(shape, "", dtype=object)
+    labels[ys - y0, xs - x0] = (spots_df['spot_id'] + " – " + spots_df['status']).to_numpy()
+    return z, labels, np.arange(x0, x0 + shape[1]), np.arange(y0, y0 + shape[0])
+
+
+def render_spot_grid(spots_df):
+    import plotly.graph_objects as go
+
+    z, labels, x, y = build_spot_grid(spots_df)
+    n = len(SPOT_STATUSES)
+    # Stepped colorscale: status code i owns the band [i/n, (i+1)/n]
+    colorscale = []
+    for i, status in enumerate(SPOT_STATUSES):
+        colorscale += [[i / n, STATUS_COLORS[status]], [(i + 1) / n, STATUS_COLORS[status]]]
+
+    fig = go.Figure(go.Heatmap(
+        z=z, x=x, y=y, text=labels, hoverinfo="text",
+        colorscale=colorscale, zmin=-0.5, zmax=n - 0.5, xgap=2, ygap=2,
+        colorbar=dict(tickvals=list(range(n)), ticktext=SPOT_STATUSES, title="Status")
+    ))
+    fig.update_layout(height=min(150 + 24 * len(y), 700), xaxis_title="Spot #", yaxis_title="Row",
+                      margin=dict(t=20, b=20))
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def render_spot_editor(spot, db):
+    spot_status = str(spot['status']).strip().lower()
+    with st.form(f"edit_{spot['spot_id']}"):
+        st.markdown(f"**{spot['spot_id']}** · Zone {spot['zone']} · Level {spot['level']}")
+        new_status = st.selectbox(
+            "Status", SPOT_STATUSES,
+            index=SPOT_STATUSES.index(spot_status) if spot_status in SPOT_STATUSES else 0
+        )
+        new_plate = st.text_input("Plate Number", value=spot['plate_number'])
+        reserved_by = st.text_input("Reserved By", value=spot['reserved_by'])
+        reserved_until = st.text_input("Reserved Until", value=spot['reserved_until'])
+
+        if st.form_submit_button(f"✅ Apply to {spot['spot_id']}"):
+            db.update_spot_status(
+                spot_id=spot['spot_id'],
+                status=new_status,
+                plate_number=new_plate,
+                reserved_by=reserved_by,
+                reserved_until=reserved_until,
+                lot=spot['lot']
+            )
+            st.success(f"🔄 {spot['spot_id']} updated to '{new_status}'")
+            st.rerun()  # UI + map refresh
+
 
 def render_admin_spot_map(spots_df, db):
     st.header("🗺️ Live Spot Map – Admin Control")
+    if st.toggle("🔴 Live refresh", key="admin_map_live_toggle"):
+        spots_df, _ = follow_spot_changes(db, "admin_map_live", spots_df)
+        watch_changes(db, "admin_map_live")
+    else:
+        st.session_state.pop("admin_map_live", None)
+    render_spot_map_body(spots_df, db)
 
-    zones = sorted(spots_df['zone'].unique())
-    for zone in zones:
-        st.subheader(f"Zone {zone}")
-        zone_spots = spots_df[spots_df['zone'] == zone]
-
-        for _, spot in zone_spots.iterrows():
-            # Safely get status and emoji
-            spot_status = str(spot['status']).strip().lower()
-            status_icon = {
-                "available": "🟢",
-                "reserved": "🟡",
-                "occupied": "🔴",
-                "maintenance": "🔴"
-            }.get(spot_status, "❓")
-
-            with st.expander(f"{status_icon} {spot['spot_id']} – {spot_status.capitalize()}"):
-                new_status = st.selectbox(
-                    "Status",
-                    ["available", "reserved", "occupied", "maintenance"],
-                    index=["available", "reserved", "occupied", "maintenance"].index(spot_status),
-                    key=f"status_{spot['spot_id']}"
-                )
-                new_plate = st.text_input("Plate Number", value=spot['plate_number'], key=f"plate_{spot['spot_id']}")
-                reserved_by = st.text_input("Reserved By", value=spot['reserved_by'], key=f"by_{spot['spot_id']}")
-                reserved_until = st.text_input("Reserved Until", value=spot['reserved_until'], key=f"until_{spot['spot_id']}")
-
-                if st.button(f"✅ Apply to {spot['spot_id']}", key=f"btn_{spot['spot_id']}"):
-                    db.update_spot_status(
-                        spot_id=spot['spot_id'],
-                        status=new_status,
-                        plate_number=new_plate,
-                        reserved_by=reserved_by,
-                        reserved_until=reserved_until
-                    )
-                    st.success(f"🔄 {spot['spot_id']} updated to '{new_status}'")
-                    st.rerun()  # UI + map refresh
 
-    st.markdown("---")
-    st.subheader("📊 Spot Map Chart")
-
-    # Reload after updates
-    spots_df = db.get_parking_spots()
-
-    spots_df['x'] = spots_df['spot_id'].str.extract('(\d+)').astype(int)
-    spots_df['y'] = spots_df['zone'].map({'A': 4, 'B': 3, 'S': 2, 'E': 1})
-
-    # Make sure all statuses appear (even if count = 0)
-    for status in ["available", "reserved", "occupied", "maintenance"]:
-        if status not in spots_df['status'].unique():
-            dummy_row = {
-                'spot_id': f'DUMMY_{status}',
-                'zone': 'Z',
-                'status': status,
-                'plate_number': '',
-                'reserved_by': '',
-                'reserved_until': '',
-                'last_updated': '',
-                'x': -1,  # hidden from view
-                'y': -1
-            }
-            spots_df = pd.concat([spots_df, pd.DataFrame([dummy_row])], ignore_index=True)
-
-    color_map = {
-        "available": "green",
-        "reserved": "orange",
-        "occupied": "red",
-        "maintenance": "gray"
-    }
-
-    fig = px.scatter(
-        spots_df,
-        x='x',
-        y='y',
-        text='spot_id',
-        color='status',
-        color_discrete_map=color_map,
-        size=[20] * len(spots_df),  # 🔍 Force all dots to be the same size
-        size_max=20,  # 📏 Control size scaling
-        height=400
-    )
-    fig.update_traces(textposition='top center')
-    fig.update_layout(
-        showlegend=True,
-        yaxis_title="Zone",
-        xaxis_title="Spot #",
-        legend_title="Status"
+def render_spot_map_body(spots_df, db):
+    # ---- Scope: one lot level at a time ----
+    lots = db.lots()
+    col1, col2 = st.columns(2)
+    lot = col1.selectbox("Lot", lots, format_func=db.layout.lot_name) if len(lots) > 1 else lots[0]
+    spots_df = spots_df[spots_df['lot'] == lot]
+    levels = sorted(spots_df['level'].unique())
+    level = col2.selectbox("Level", levels) if len(levels) > 1 else levels[0]
+    spots_df = spots_df[spots_df['level'] == level]
+
+    # ---- Filters ----
+    col1, col2, col3 = st.columns([1, 1, 2])
+    zones = col1.multiselect("Zones", sorted(spots_df['zone'].unique()))
+    statuses = col2.multiselect("Statuses", SPOT_STATUSES)
+    search = col3.text_input("🔎 Search spot or plate").strip().upper()
+
+    filtered = spots_df
+    if zones:
+        filtered = filtered[filtered['zone'].isin(zones)]
+    if statuses:
+        filtered = filtered[filtered['status'].isin(statuses)]
+    if search:
+        filtered = filtered[
+            filtered['spot_id'].str.upper().str.contains(search, regex=False)
+            | filtered['plate_number'].str.upper().str.contains(search, regex=False)
+        ]
+
+    counts = spots_df['status'].value_counts()
+    cols = st.columns(len(SPOT_STATUSES))
+    for col, status in zip(cols, SPOT_STATUSES):
+        col.metric(status.capitalize(), int(counts.get(status, 0)))
+
+    if filtered.empty:
+        st.info("No spots match the current filters.")
+        return
+
+    st.subheader("📊 Spot Map")
+    render_spot_grid(filtered)
+
+    # ---- Paginated spot list ----
+    st.subheader(f"📋 Spots ({len(filtered)})")
+    pages = max(1, -(-len(filtered) // SPOTS_PER_PAGE))
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1) if pages > 1 else 1
+    page_df = filtered.sort_values('spot_id').iloc[(page - 1) * SPOTS_PER_PAGE: page * SPOTS_PER_PAGE]
+    st.dataframe(
+        page_df[['spot_id', 'zone', 'status', 'plate_number', 'reserved_by', 'reserved_until', 'last_updated']],
+        hide_index=True, use_container_width=True
     )
-    st.plotly_chart(fig, use_container_width=True)
 
+    # ---- Edit form, only for the selected spot ----
+    st.subheader("⚙️ Manage Spot")
+    spot_id = st.selectbox("Spot", page_df['spot_id'])
+    render_spot_editor(page_df[page_df['spot_id'] == spot_id].iloc[0], db)
+
+
+
+def render_metrics_page():
+    import metrics
 
+    st.header("📈 Metrics")
+    if not metrics.ENABLED:
+        st.info("Instrumentation is off in this process. Start the app and detectors with "
+                "`SMARTPARK_METRICS=1` to collect timings and counters.")
 
+    # The app's own registry is read live; other processes are read from their export files
+    exports = metrics.read_exports()
+    if metrics.ENABLED:
+        exports["web"] = metrics.render_prometheus()
+    if not exports:
+        st.info("No metrics exported yet.")
+        return
 
+    process = st.selectbox("Process", sorted(exports))
+    series, histograms = metrics.summarize(exports[process])
 
+    if histograms:
+        st.subheader("⏱️ Timings (seconds)")
+        st.dataframe(pd.DataFrame(histograms), hide_index=True, use_container_width=True)
 
+    series_df = pd.DataFrame(series, columns=["metric", "labels", "value"])
+    if not series_df.empty:
+        st.subheader("🔢 Counters and Gauges")
+        st.dataframe(series_df, hide_index=True, use_container_width=True)
 
+        lookups = series_df[series_df["metric"] == "smartpark_cache_lookups_total"].set_index("labels")["value"]
+        misses = series_df[series_df["metric"] == "smartpark_cache_misses_total"].set_index("labels")["value"]
+        if not lookups.empty:
+            st.subheader("🗄️ Cache Hit Rate")
+            cache = pd.DataFrame({"lookups": lookups, "misses": misses.reindex(lookups.index, fill_value=0)})
+            cache["hits"] = cache["lookups"] - cache["misses"]
+            cache["hit_rate"] = (cache["hits"] / cache["lookups"]).round(3)
+            st.dataframe(cache, use_container_width=True)
 
+    st.download_button("⬇️ Prometheus text", exports[process], file_name=f"{process}.prom")
 
 
 __all__ = ["render_admin_spot_map"]
@@ -0,0 +1,388 @@
+"""Async HTTP API over ``ParkingDatabase`` for gates, kiosks and ANPR producers.
+
+A plain ASGI application, so any ASGI server can host it:
+
+    python api.py --data-dir parking_data --port 8000
+    uvicorn api:app --port 8000            # same thing, data dir from SMARTPARK_DATA_DIR
+
+Reads are answered from an in-memory snapshot of spots, active reservations
+and recent detections, which follows the change feed so writes made by the
+Streamlit app or the detector show up within one poll. Writes go through a
+queue drained by a single writer task, one ``ParkingDatabase`` call at a
+time, so a claim is checked and applied against the same state and the event
+loop never blocks on file I/O.
+
+    GET  /health                    liveness, snapshot seq and writer queue depth
+    GET  /availability?lot=         spot counts per lot, zone and status
+    GET  /spots?lot=&zone=&status=  spot rows
+    GET  /spots/{spot_id}
+    GET  /plates/{plate}            spots, active reservations and last sighting of a plate
+    GET  /plates/{plate}/sightings?start=&end=&camera=&limit=
+                                    detection history from the detection log, newest first
+    POST /reservations              {spot_id, plate_number, name, email, phone, duration}
+    POST /detections                {"detections": [{plate_number, confidence, camera_location}, ...]}
+"""
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from urllib.parse import parse_qs, unquote
+
+import metrics
+from fileutil import default_data_dir
+from parking_db import RESERVATION_COLUMNS, ParkingDatabase, SpotUnavailable
+
+FOLLOW_INTERVAL = 0.25
+MAX_BODY_BYTES = 1 << 20
+MAX_DURATION_MINUTES = 24 * 60
+# Metric labels are limited to these so scans of random paths can't grow the series count
+ROUTE_LABELS = {"health", "availability", "spots", "plates", "reservations", "detections"}
+METHOD_LABELS = {"GET", "POST"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ==== Snapshot ====
+class Snapshot:
+    """In-memory view of parking state, kept current from change-feed events."""
+
+    def __init__(self):
+        self.seq = 0
+        self.spots = {}          # spot_id -> spot dict
+        self.reservations = {}   # reservation id -> active reservation row
+        self.plates = {}         # plate -> {"spots": spot ids, "reservations": reservation ids}
+        self.last_seen = {}      # plate -> latest detection event
+        self.emergency = set()
+
+    def load(self, db):
+        """Full load from disk; runs in a worker thread."""
+        seq = db.changes.last_seq()
+        spots = {row['spot_id']: row for row in db.get_parking_spots().to_dict('records')}
+        reservations = {}
+        cursor = None
+        while True:
+            page, cursor = db.query_reservations(status="active", after=cursor, limit=1000)
+            for row in page.to_dict('records'):
+                row = _reservation_row(row)
+                reservations[row['id']] = row
+            if cursor is None:
+                break
+        plates = {}
+        for spot_id, spot in spots.items():
+            _link(plates, spot['plate_number'], "spots", spot_id)
+        for reservation_id, row in reservations.items():
+            _link(plates, row['plate_number'], "reservations", reservation_id)
+        self.spots, self.reservations, self.plates, self.seq = spots, reservations, plates, seq
+        self.emergency = db.emergency_plates()
+
+    def apply(self, events):
+        """Fold events in; returns False when they can't be applied and a reload is needed."""
+        for event in events:
+            kind = event["type"]
+            if kind == "spot":
+                spot = self.spots.get(event["spot_id"])
+                if spot is not None:
+                    _unlink(self.plates, spot['plate_number'], "spots", spot['spot_id'])
+                    spot.update({k: v for k, v in event.items() if k not in ("type", "seq", "ts")})
+                    _link(self.plates, spot['plate_number'], "spots", spot['spot_id'])
+            elif kind == "reservation":
+                old = self.reservations.pop(event["id"], None)
+                if old is not None:
+                    _unlink(self.plates, old['plate_number'], "reservations", old['id'])
+                if event["status"] == "active":
+                    row = self.reservations[event["id"]] = _reservation_row(event)
+                    _link(self.plates, row['plate_number'], "reservations", row['id'])
+            elif kind == "reservations_cleared":
+                for row in self.reservations.values():
+                    _unlink(self.plates, row['plate_number'], "reservations", row['id'])
+                self.reservations.clear()
+            elif kind == "detection":
+                self.last_seen[event["plate_number"]] = event
+            elif kind == "spots_reset":
+                return False
+            self.seq = event["seq"]
+        return True
+
+
+def _reservation_row(row):
+    """A reservation as read from the history file (strings), keyed by its integer id."""
+    row = {c: str(row.get(c, '')) for c in RESERVATION_COLUMNS}
+    row['id'] = int(row['id'])
+    return row
+
+
+def _link(plates, plate, kind, key):
+    if plate:
+        plates.setdefault(plate, {"spots": set(), "reservations": set()})[kind].add(key)
+
+
+def _unlink(plates, plate, kind, key):
+    entry = plates.get(plate)
+    if entry is not None:
+        entry[kind].discard(key)
+        if not entry["spots"] and not entry["reservations"]:
+            del plates[plate]
+
+
+# ==== Service ====
+class ParkingService:
+    def __init__(self, data_dir=None):
+        self.data_dir = data_dir
+        self.db = None
+        self.snapshot = Snapshot()
+        self.queue = None
+        self._tasks = []
+        self._refresh_lock = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.db = await loop.run_in_executor(None, ParkingDatabase, self.data_dir)
+        await loop.run_in_executor(None, self.snapshot.load, self.db)
+        self.queue = asyncio.Queue()
+        self._refresh_lock = asyncio.Lock()
+        self._tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._follow())]
+
+    async def stop(self):
+        # Let queued writes finish before the writer exits
+        await self.queue.put(None)
+        await self._tasks[0]
+        self._tasks[1].cancel()
+
+    # ---- Change feed ----
+    async def _catch_up(self):
+        async with self._refresh_lock:
+            events = self.db.changes.since(self.snapshot.seq)
+            if events is None or not self.snapshot.apply(events):
+                await asyncio.get_running_loop().run_in_executor(None, self.snapshot.load, self.db)
+
+    async def _follow(self):
+        while True:
+            await asyncio.sleep(FOLLOW_INTERVAL)
+            try:
+                await self._catch_up()
+            except Exception as exc:  # keep serving the last good snapshot
+                print(f"Snapshot refresh failed: {exc}")
+
+    # ---- Writes ----
+    async def submit(self, fn, *args):
+        """Queue ``fn(*args)`` for the writer task and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((fn, args, future))
+        metrics.set_gauge("smartpark_api_write_queue_depth", self.queue.qsize())
+        return await future
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            metrics.set_gauge("smartpark_api_write_queue_depth", self.queue.qsize())
+            if item is None:
+                return
+            fn, args, future = item
+            try:
+                # Check writes against everything other processes have published so far
+                await self._catch_up()
+                result = await loop.run_in_executor(None, fn, *args)
+                # Apply our own events now so the next read sees this write
+                await self._catch_up()
+                future.set_result(result)
+            except Exception as exc:
+                future.set_exception(exc)
+
+    def _claim(self, spot_id, plate, name, email, phone, duration):
+        spot = self.snapshot.spots.get(spot_id)
+        if spot is None:
+            raise HTTPError(404, f"Unknown spot: {spot_id}")
+        # The snapshot can lag other processes; availability is checked again in the
+        # shard under its file lock
+        try:
+            self.db.add_reservation(spot_id, plate, name, email, phone, duration, lot=spot['lot'],
+                                    require_available=True)
+        except SpotUnavailable as exc:
+            raise HTTPError(409, str(exc))
+
+    # ---- Handlers ----
+    def health(self, query):
+        return 200, {"status": "ok", "seq": self.snapshot.seq, "write_queue": self.queue.qsize()}
+
+    def availability(self, query):
+        lot = query.get("lot")
+        counts = {}
+        for spot in self.snapshot.spots.values():
+            if lot and spot['lot'] != lot:
+                continue
+            key = (spot['lot'], spot['zone'], spot['status'])
+            counts[key] = counts.get(key, 0) + 1
+        return 200, {"availability": [
+            {"lot": l, "zone": z, "status": s, "spots": n} for (l, z, s), n in sorted(counts.items())
+        ]}
+
+    def list_spots(self, query):
+        filters = {k: query[k] for k in ("lot", "zone", "status") if k in query}
+        spots = [s for s in self.snapshot.spots.values() if all(s[k] == v for k, v in filters.items())]
+        return 200, {"spots": spots}
+
+    def get_spot(self, query, spot_id):
+        spot = self.snapshot.spots.get(spot_id.upper())
+        if spot is None:
+            raise HTTPError(404, f"Unknown spot: {spot_id}")
+        return 200, spot
+
+    def lookup_plate(self, query, plate):
+        plate = plate.replace(' ', '').upper()
+        snapshot = self.snapshot
+        entry = snapshot.plates.get(plate, {})
+        # .get: a reload swaps the maps in from another thread, not all at once
+        spots = (snapshot.spots.get(s) for s in sorted(entry.get("spots", ())))
+        reservations = (snapshot.reservations.get(r) for r in sorted(entry.get("reservations", ())))
+        return 200, {
+            "plate_number": plate,
+            "emergency": plate in snapshot.emergency,
+            "spots": [s for s in spots if s is not None],
+            "reservations": [r for r in reservations if r is not None],
+            "last_seen": self.snapshot.last_seen.get(plate),
+        }
+
+    async def plate_sightings(self, query, plate):
+        try:
+            limit = min(int(query.get("limit", 100)), 1000)
+        except ValueError:
+            raise HTTPError(400, "limit must be an integer")
+        try:
+            start, end = (datetime.fromisoformat(query[k]) if query.get(k) else None for k in ("start", "end"))
+        except ValueError:
+            raise HTTPError(400, "start and end must be ISO 8601 date-times")
+        # A log read, not a write: straight to the executor rather than through the writer queue
+        rows = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.db.plate_sightings(plate, start=start, end=end,
+                                                  camera=query.get("camera"), limit=limit))
+        return 200, {"plate_number": plate.replace(' ', '').upper(), "sightings": rows}
+
+    async def reserve(self, body):
+        try:
+            args = (str(body['spot_id']).upper(), str(body['plate_number']).replace(' ', '').upper(),
+                    body.get('name', ''), body.get('email', ''), body.get('phone', ''),
+                    int(body.get('duration', 60)))
+        except (KeyError, TypeError, ValueError, OverflowError) as exc:
+            raise HTTPError(400, f"Invalid reservation: {exc}")
+        if not 0 < args[-1] <= MAX_DURATION_MINUTES:
+            raise HTTPError(400, f"duration must be between 1 and {MAX_DURATION_MINUTES} minutes")
+        await self.submit(self._claim, *args)
+        return 201, {"reserved": args[0], "plate_number": args[1]}
+
+    async def ingest_detections(self, body):
+        detections = body.get('detections') if isinstance(body, dict) else body
+        if not isinstance(detections, list):
+            raise HTTPError(400, "Expected a list of detections")
+        try:
+            rows = await self.submit(self.db.add_detections, detections)
+        except (KeyError, TypeError, ValueError) as exc:
+            raise HTTPError(400, f"Invalid detection: {exc}")
+        return 201, {"ingested": len(rows)}
+
+    # ---- Routing ----
+    async def route(self, method, path, query, body):
+        parts = [unquote(p) for p in path.strip('/').split('/') if p]
+        if method == "GET":
+            if parts == ["health"]:
+                return self.health(query)
+            if parts == ["availability"]:
+                return self.availability(query)
+            if parts == ["spots"]:
+                return self.list_spots(query)
+            if len(parts) == 2 and parts[0] == "spots":
+                return self.get_spot(query, parts[1])
+            if len(parts) == 2 and parts[0] == "plates":
+                return self.lookup_plate(query, parts[1])
+            if len(parts) == 3 and parts[0] == "plates" and parts[2] == "sightings":
+                return await self.plate_sightings(query, parts[1])
+        elif method == "POST":
+            if parts == ["reservations"]:
+                return await self.reserve(body)
+            if parts == ["detections"]:
+                return await self.ingest_detections(body)
+        raise HTTPError(404, f"No route for {method} {path}")
+
+
+# ==== ASGI ====
+async def _read_body(receive):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        size += len(chunks[-1])
+        if size > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, default=str).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def create_app(data_dir=None):
+    service = ParkingService(data_dir)
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await service.start()
+                    await send({"type": "lifespan.startup.complete"})
+                elif message['type'] == 'lifespan.shutdown':
+                    await service.stop()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        method, path = scope['method'], scope['path']
+        query = {k: v[-1] for k, v in parse_qs(scope.get('query_string', b'').decode()).items()}
+        route = (path.split('/') + [''])[1]
+        with metrics.timer("smartpark_api_request_seconds",
+                           method=method if method in METHOD_LABELS else "other",
+                           route=route if route in ROUTE_LABELS else "other"):
+            try:
+                raw = await _read_body(receive) if method == "POST" else b''
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    raise HTTPError(400, "Body is not valid JSON")
+                status, payload = await service.route(method, path, query, body)
+            except HTTPError as exc:
+                status, payload = exc.status, {"error": exc.message}
+            await _send_json(send, status, payload)
+
+    app.service = service
+    return app
+
+
+app = create_app(default_data_dir())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartPark HTTP API")
+    parser.add_argument("--data-dir", default=default_data_dir())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    import uvicorn
+    metrics.start_exporter("api")
+    uvicorn.run(create_app(args.data_dir), host=args.host, port=args.port,
+                log_level="warning", lifespan="on")
+
+
+if __name__ == "__main__":
+    main()
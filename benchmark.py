@@ -0,0 +1,154 @@
+"""Latency and memory benchmarks for the SmartPark storage layer.
+
+For each scale the suite generates a fresh data directory with
+``generate_data.generate`` and then times the ``ParkingDatabase`` and
+``UserDatabase`` operations the app calls on every interaction.
+
+    python benchmark.py --scales small medium --iterations 20
+    python benchmark.py --data-dir bench_data      # reuse an existing directory
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import generate_data
+from user_db import UserDatabase
+from parking_db import ParkingDatabase
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def max_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(fn, iterations):
+    """Time ``fn`` ``iterations`` times, then once more under tracemalloc for peak allocation."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples),
+        "peak_alloc_mb": peak / (1024 * 1024),
+    }
+
+
+def build_operations(data_dir, rng):
+    """Return ``{name: zero-arg callable}`` for every benchmarked operation."""
+    db = ParkingDatabase(data_dir=data_dir)
+    users = UserDatabase(data_dir=data_dir)
+
+    spot_ids = list(db.get_parking_spots()['spot_id'])
+    usernames = list(users.load_users()['username'])
+
+    def add_reservation():
+        spot_id = rng.choice(spot_ids)
+        db.add_reservation(spot_id, generate_data.random_plate(rng), "Bench", "bench@example.com",
+                           "0600000000", rng.choice(generate_data.DURATIONS))
+
+    def update_spot_status():
+        db.update_spot_status(rng.choice(spot_ids), rng.choice(["available", "occupied"]),
+                              generate_data.random_plate(rng))
+
+    def login():
+        users.login(rng.choice(usernames), generate_data.USER_PASSWORD)
+
+    first_lot = db.lots()[0]
+    ops = {
+        "get_parking_spots": db.get_parking_spots,
+        "get_parking_spots(lot)": lambda: db.get_parking_spots(lot=first_lot),
+        "get_reservations_history": db.get_reservations_history,
+        "update_spot_status": update_spot_status,
+        "add_reservation": add_reservation,
+        "clean_expired_reservations": db.clean_expired_reservations,
+        "query_reservations": lambda: db.query_reservations(limit=50),
+        "query_reservations(plate)": lambda: db.query_reservations(
+            plate=generate_data.random_plate(rng), limit=50),
+    }
+    if usernames:
+        ops["UserDatabase.login"] = login
+        ops["UserDatabase.get_user_points"] = lambda: users.get_user_points(rng.choice(usernames))
+        ops["UserDatabase.redeem_reward"] = lambda: users.redeem_reward(rng.choice(usernames), 1)
+        ops["UserDatabase.query_users"] = lambda: users.query_users(after=rng.choice(usernames), limit=50)
+    return ops
+
+
+def run_scale(name, data_dir, iterations, seed):
+    rng = random.Random(seed)
+    results = {}
+    for op, fn in build_operations(data_dir, rng).items():
+        results[op] = measure(fn, iterations)
+        print(f"  {op:<28} p50 {results[op]['p50_ms']:>10.2f} ms"
+              f"  p95 {results[op]['p95_ms']:>10.2f} ms"
+              f"  p99 {results[op]['p99_ms']:>10.2f} ms"
+              f"  peak {results[op]['peak_alloc_mb']:>8.1f} MB")
+    return {"scale": name, "data_dir": data_dir, "max_rss_mb": max_rss_mb(), "operations": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"],
+                        choices=list(generate_data.SCALES))
+    parser.add_argument("--data-dir", help="benchmark an existing data directory instead of generating")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep generated data directories")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    reports = []
+    if args.data_dir:
+        print(f"== {args.data_dir}")
+        reports.append(run_scale(args.data_dir, args.data_dir, args.iterations, args.seed))
+    else:
+        for scale in args.scales:
+            data_dir = tempfile.mkdtemp(prefix=f"smartpark_{scale}_")
+            print(f"== {scale}: generating into {data_dir}")
+            start = time.perf_counter()
+            counts = generate_data.generate(data_dir, seed=args.seed, **generate_data.SCALES[scale])
+            print(f"  generated {sum(counts.values()):,} rows in {time.perf_counter() - start:.1f} s")
+            try:
+                reports.append(run_scale(scale, data_dir, args.iterations, args.seed))
+            finally:
+                if not args.keep:
+                    shutil.rmtree(data_dir, ignore_errors=True)
+
+    for report in reports:
+        print(f"{report['scale']}: max RSS {report['max_rss_mb']:.1f} MB")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(reports, file, indent=2)
+        print(f"Results written to {os.path.abspath(args.json)}")
+
+
+if __name__ == "__main__":
+    main()
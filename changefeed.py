@@ -0,0 +1,126 @@
+"""Sequenced change feed for spot, reservation and detection events.
+
+Every write to parking state is emitted as one JSON line in ``changes.log``
+with a monotonically increasing ``seq``. Readers keep the last sequence
+number they saw and call ``since(seq)`` to get only what changed after it.
+The newest ``capacity`` events are held in an in-memory ring; the log on disk
+is the durable tail shared between processes (the app, the detector, the
+API) and is trimmed back to ``capacity`` events once it holds twice that.
+
+Only the standard library is used so the detector can emit without pandas.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+import metrics
+from fileutil import FileLock, TrackedFile
+
+
+class ChangeFeed:
+    def __init__(self, path, capacity=10_000, poll_interval=0.25):
+        self.path = path
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._ring = deque(maxlen=capacity)
+        self._seq = 0
+        self._file = TrackedFile(path)
+        self._offset = 0
+        self._lines = 0        # events currently in the log file
+        self._last_poll = 0.0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if not os.path.exists(path):
+            open(path, "a").close()
+        with self._lock:
+            self._catch_up()
+
+    # ---- Log reading ----
+    def _catch_up(self):
+        """Read events other processes appended; start over if the log was trimmed."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if self._file.replaced(stat) or stat.st_size < self._offset:
+            self._file.track()
+            self._offset, self._lines = 0, 0
+            self._ring.clear()
+        elif stat.st_size == self._offset:
+            return
+        with open(self.path, "rb") as file:
+            if not self._file.matches(file):
+                self._file.close()  # trimmed again since track(); start over on the next poll
+                return
+            file.seek(self._offset)
+            data = file.read()
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            self._lines += 1
+            self._ring.append(event)
+            self._seq = event["seq"]
+
+    def _poll(self, force=False):
+        now = time.monotonic()
+        if force or now - self._last_poll >= self.poll_interval:
+            self._last_poll = now
+            self._catch_up()
+
+    # ---- Writing ----
+    def emit(self, events):
+        """Append ``events`` (dicts with at least a ``type``); returns the last seq assigned."""
+        if not events:
+            return self.last_seq()
+        with self._lock, FileLock(f"{self.path}.lock"):
+            self._catch_up()
+            now = time.time()
+            lines = []
+            for event in events:
+                self._seq += 1
+                event = {"seq": self._seq, "ts": now, **event}
+                self._ring.append(event)
+                lines.append(json.dumps(event, default=str))
+            with open(self.path, "a") as file:
+                file.write("\n".join(lines) + "\n")
+            self._offset = os.path.getsize(self.path)
+            self._lines += len(lines)
+            if self._lines >= 2 * self.capacity:
+                self._trim()
+            metrics.set_gauge("smartpark_changefeed_log_events", self._lines)
+            return self._seq
+
+    def _trim(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as file:
+            for event in self._ring:
+                file.write(json.dumps(event, default=str) + "\n")
+        os.replace(tmp, self.path)
+        self._offset, self._lines = self._file.track().st_size, len(self._ring)
+
+    # ---- Reading ----
+    def last_seq(self):
+        with self._lock:
+            self._poll()
+            return self._seq
+
+    def since(self, seq):
+        """Events after ``seq``, oldest first.
+
+        Returns ``[]`` when nothing changed (the common case costs at most
+        one stat() per ``poll_interval``), or None when ``seq`` has already
+        fallen out of the ring and the caller must reload from scratch.
+        """
+        with self._lock:
+            self._poll()
+            if seq >= self._seq:
+                return []
+            if not self._ring or seq < self._ring[0]["seq"] - 1:
+                return None
+            return list(islice(self._ring, seq - self._ring[0]["seq"] + 1, None))
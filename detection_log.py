@@ -0,0 +1,371 @@
+"""Segmented, compressed, time-indexed ANPR detection log.
+
+Detections are appended to one active segment, a header-less CSV in
+``detections/``. Once it reaches ``max_segment_bytes`` or has been open for
+``max_segment_seconds`` it is closed:
+
+- the rows are cut into blocks of ``block_rows`` and written as one gzip
+  member per block (``seg-<opened>.csv.gz``; any gzip reader sees one file);
+- a sidecar ``seg-<opened>.idx.json`` records, per block, its byte range,
+  id and ``detection_time`` range, the cameras seen and a Bloom filter of
+  the plates seen.
+
+A query reads only the blocks whose index entry can match its time range,
+camera and plate, so "when did plate X enter" touches a handful of blocks
+however long the history is. Retention deletes whole closed segments once
+they are older than ``retention_days`` or the log exceeds
+``max_total_bytes``; nothing is ever rewritten.
+
+Appends and rotation take a file lock, so every detector process and the
+API can share one log. Settings come from ``<data_dir>/detection_log.json``
+when present (see ``DEFAULTS``). Only the standard library is used so the
+detector can write without pandas.
+"""
+import base64
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from itertools import islice
+
+from fileutil import FileLock, default_data_dir
+
+COLUMNS = ['id', 'plate_number', 'confidence', 'detection_time',
+           'camera_location', 'is_emergency', 'processed']
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+SEGMENT_NAME_FORMAT = "%Y%m%d-%H%M%S-%f"
+CONFIG_FILENAME = "detection_log.json"
+
+DEFAULTS = {
+    "max_segment_bytes": 64 * 1024 * 1024,
+    "max_segment_seconds": 24 * 3600,
+    "block_rows": 4096,
+    "retention_days": 90,
+    "max_total_bytes": None,
+}
+
+
+# ==== Bloom filter ====
+def _bloom_positions(value, bits, hashes):
+    digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+    h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def build_bloom(values, bits_per_value=10, hashes=7):
+    """``(bit count, base64 bitmap)`` sized for ~1% false positives."""
+    bits = max(64, len(values) * bits_per_value)
+    bitmap = bytearray((bits + 7) // 8)
+    for value in values:
+        for pos in _bloom_positions(value, bits, hashes):
+            bitmap[pos >> 3] |= 1 << (pos & 7)
+    return bits, base64.b64encode(bytes(bitmap)).decode()
+
+
+def bloom_contains(bloom, value, hashes=7):
+    bits, encoded = bloom
+    bitmap = base64.b64decode(encoded)
+    return all(bitmap[pos >> 3] & (1 << (pos & 7)) for pos in _bloom_positions(value, bits, hashes))
+
+
+def _time_text(value):
+    """A query bound as stored text; strings are parsed as ISO 8601 (ValueError if they aren't)."""
+    if value is None:
+        return None
+    if not hasattr(value, "strftime"):
+        value = datetime.fromisoformat(str(value))
+    return value.strftime(TIME_FORMAT)
+
+
+# ==== Log ====
+class DetectionLog:
+    def __init__(self, log_dir, **settings):
+        self.log_dir = log_dir
+        self.settings = {**DEFAULTS, **settings}
+        os.makedirs(log_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file_lock = os.path.join(log_dir, ".lock")
+        self._indexes = {}  # index path -> (mtime_ns, index dict)
+
+    @classmethod
+    def open(cls, data_dir=None):
+        """The log under ``<data_dir>/detections`` with settings from ``detection_log.json``."""
+        data_dir = data_dir or default_data_dir()
+        settings = {}
+        config = os.path.join(data_dir, CONFIG_FILENAME)
+        if os.path.exists(config):
+            with open(config) as file:
+                settings = json.load(file)
+        return cls(os.path.join(data_dir, "detections"), **settings)
+
+    # ---- Segment files ----
+    def _path(self, name, suffix):
+        return os.path.join(self.log_dir, f"seg-{name}{suffix}")
+
+    def _segments(self):
+        """``(closed segment names, active segment name or None)``, oldest first."""
+        closed, active = [], []
+        for filename in os.listdir(self.log_dir):
+            if not filename.startswith("seg-"):
+                continue
+            if filename.endswith(".idx.json"):
+                closed.append(filename[4:-len(".idx.json")])
+            elif filename.endswith(".csv"):
+                active.append(filename[4:-len(".csv")])
+        closed.sort()
+        # An active file whose index already exists was closed by a run that died before removing it
+        active = sorted(set(active) - set(closed))
+        return closed, (active[-1] if active else None)
+
+    def _index(self, name):
+        path = self._path(name, ".idx.json")
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._indexes.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path) as file:
+                cached = self._indexes[path] = (mtime, json.load(file))
+        return cached[1]
+
+    @staticmethod
+    def _opened_at(name):
+        return datetime.strptime(name, SEGMENT_NAME_FORMAT)
+
+    # ---- Writing ----
+    def _last_id(self, closed, active):
+        if active:
+            with open(self._path(active, ".csv"), "rb") as file:
+                file.seek(0, os.SEEK_END)
+                file.seek(max(0, file.tell() - 4096))
+                lines = file.read().splitlines()
+            if lines:
+                return int(lines[-1].split(b",", 1)[0])
+        return self._index(closed[-1])["last_id"] if closed else 0
+
+    def append(self, detections):
+        """Append dicts with the detection columns (``id`` is assigned); returns them with ids."""
+        if not detections:
+            return []
+        with self._lock, FileLock(self._file_lock):
+            closed, active = self._segments()
+            next_id = self._last_id(closed, active) + 1
+            if active is None:
+                active = self._new_segment_name()
+            rows = [{**detection, "id": next_id + offset} for offset, detection in enumerate(detections)]
+            buffer = io.StringIO()
+            csv.DictWriter(buffer, fieldnames=COLUMNS, extrasaction="ignore").writerows(rows)
+            path = self._path(active, ".csv")
+            with open(path, "a", newline="") as file:
+                file.write(buffer.getvalue())
+            if self._should_rotate(active, os.path.getsize(path)):
+                self._close_segment(active)
+                self._apply_retention()
+        return rows
+
+    def _new_segment_name(self):
+        # Sortable by open time; microseconds keep back-to-back rotations apart
+        return datetime.now().strftime(SEGMENT_NAME_FORMAT)
+
+    def _should_rotate(self, name, size):
+        age = (datetime.now() - self._opened_at(name)).total_seconds()
+        return size >= self.settings["max_segment_bytes"] or age >= self.settings["max_segment_seconds"]
+
+    def rotate(self):
+        """Close the active segment now (if it has rows) and apply retention."""
+        with self._lock, FileLock(self._file_lock):
+            _, active = self._segments()
+            if active is not None and os.path.getsize(self._path(active, ".csv")):
+                self._close_segment(active)
+            self._apply_retention()
+
+    def maybe_rotate(self):
+        """Rotate if the active segment is over its age limit (for quiet periods with no appends)."""
+        _, active = self._segments()
+        if active is not None and self._should_rotate(active, os.path.getsize(self._path(active, ".csv"))):
+            self.rotate()
+
+    def _close_segment(self, name):
+        # Streamed one block at a time so closing a segment holds at most block_rows rows
+        source = self._path(name, ".csv")
+        block_rows = self.settings["block_rows"]
+        blocks, offset, total = [], 0, 0
+        data_tmp = self._path(name, ".csv.gz.tmp")
+        with open(source, newline="") as file, open(data_tmp, "wb") as out:
+            reader = csv.reader(file)
+            while True:
+                block = list(islice(reader, block_rows))
+                if not block:
+                    break
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(block)
+                member = gzip.compress(buffer.getvalue().encode(), compresslevel=6)
+                out.write(member)
+                times = [r[3] for r in block]
+                bits, bloom = build_bloom({r[1] for r in block})
+                blocks.append({
+                    "offset": offset, "length": len(member), "rows": len(block),
+                    "first_id": int(block[0][0]), "last_id": int(block[-1][0]),
+                    "min_time": min(times), "max_time": max(times),
+                    "cameras": sorted({r[4] for r in block}),
+                    "plates_bits": bits, "plates_bloom": bloom,
+                })
+                offset += len(member)
+                total += len(block)
+        index = {
+            "segment": name, "rows": total, "bytes": offset,
+            "first_id": blocks[0]["first_id"] if blocks else 0,
+            "last_id": blocks[-1]["last_id"] if blocks else 0,
+            "min_time": min((b["min_time"] for b in blocks), default=None),
+            "max_time": max((b["max_time"] for b in blocks), default=None),
+            "cameras": sorted({c for b in blocks for c in b["cameras"]}),
+            "blocks": blocks,
+        }
+        index_tmp = self._path(name, ".idx.json.tmp")
+        with open(index_tmp, "w") as file:
+            json.dump(index, file)
+        # Data first, then the index that makes the segment visible, then drop the source
+        os.replace(data_tmp, self._path(name, ".csv.gz"))
+        os.replace(index_tmp, self._path(name, ".idx.json"))
+        os.remove(source)
+
+    # ---- Retention ----
+    def _apply_retention(self):
+        closed, _ = self._segments()
+        removed = []
+        retention_days = self.settings["retention_days"]
+        if retention_days is not None:
+            cutoff = (datetime.now() - timedelta(days=retention_days)).strftime(TIME_FORMAT)
+            for name in closed:
+                max_time = self._index(name)["max_time"]
+                if max_time is not None and max_time >= cutoff:
+                    break
+                removed.append(name)
+        max_total = self.settings["max_total_bytes"]
+        if max_total is not None:
+            kept = [n for n in closed if n not in removed]
+            total = sum(self._index(n)["bytes"] for n in kept)
+            for name in kept:
+                if total <= max_total:
+                    break
+                total -= self._index(name)["bytes"]
+                removed.append(name)
+        for name in removed:
+            # Index first so readers never see a segment without its data
+            for suffix in (".idx.json", ".csv.gz"):
+                path = self._path(name, suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+                self._indexes.pop(path, None)
+        return removed
+
+    def apply_retention(self):
+        with self._lock, FileLock(self._file_lock):
+            return self._apply_retention()
+
+    # ---- Reading ----
+    def _read_block(self, name, block):
+        with open(self._path(name, ".csv.gz"), "rb") as file:
+            file.seek(block["offset"])
+            data = gzip.decompress(file.read(block["length"]))
+        return list(csv.reader(io.StringIO(data.decode())))
+
+    def _active_rows(self, active):
+        try:
+            with open(self._path(active, ".csv"), newline="") as file:
+                data = file.read()
+        except FileNotFoundError:  # closed between listing and reading
+            return []
+        # Skip a trailing row another process is still writing
+        return list(csv.reader(io.StringIO(data[:data.rfind("\n") + 1])))
+
+    def _candidate_rows(self, start, end, camera, plate, newest_first):
+        """Raw rows from every block the index can't rule out, in (reverse) append order."""
+        closed, active = self._segments()
+        names = [(n, False) for n in closed] + ([(active, True)] if active else [])
+        if newest_first:
+            names.reverse()
+        for name, is_active in names:
+            if is_active:
+                rows = self._active_rows(name)
+                yield from (reversed(rows) if newest_first else rows)
+                continue
+            try:
+                index = self._index(name)
+            except FileNotFoundError:  # dropped by retention meanwhile
+                continue
+            if not index["blocks"] or not _overlaps(index, start, end):
+                continue
+            if camera and camera not in index["cameras"]:
+                continue
+            blocks = index["blocks"][::-1] if newest_first else index["blocks"]
+            for block in blocks:
+                if not _overlaps(block, start, end):
+                    continue
+                if camera and camera not in block["cameras"]:
+                    continue
+                if plate and not bloom_contains((block["plates_bits"], block["plates_bloom"]), plate):
+                    continue
+                try:
+                    rows = self._read_block(name, block)
+                except FileNotFoundError:
+                    break
+                yield from (reversed(rows) if newest_first else rows)
+
+    def query(self, start=None, end=None, camera=None, plate=None, limit=None, newest_first=False):
+        """Detections matching every given filter, as dicts of strings.
+
+        ``start``/``end`` bound ``detection_time`` (inclusive; datetimes or
+        ISO 8601 strings, with either a ``T`` or a space). Results come in append order (which follows detection
+        time for live detectors), newest first if asked.
+        """
+        start, end = _time_text(start), _time_text(end)
+        plate = plate.replace(" ", "").upper() if plate else None
+        results = []
+        for row in self._candidate_rows(start, end, camera, plate, newest_first):
+            if len(row) != len(COLUMNS):
+                continue
+            if plate and row[1] != plate:
+                continue
+            if camera and row[4] != camera:
+                continue
+            if (start and row[3] < start) or (end and row[3] > end):
+                continue
+            results.append(dict(zip(COLUMNS, row)))
+            if limit and len(results) >= limit:
+                break
+        return results
+
+    def last_seen(self, plate, camera=None):
+        """The most recent detection of ``plate`` (optionally at one camera), or None."""
+        rows = self.query(plate=plate, camera=camera, limit=1, newest_first=True)
+        return rows[0] if rows else None
+
+    def first_seen(self, plate, since=None, camera=None):
+        """The first detection of ``plate`` at or after ``since`` (e.g. when it entered today)."""
+        rows = self.query(start=since, plate=plate, camera=camera, limit=1)
+        return rows[0] if rows else None
+
+    def segment_files(self):
+        """``[(path, compressed)]`` of every segment, oldest first, for bulk readers."""
+        closed, active = self._segments()
+        files = [(self._path(n, ".csv.gz"), True) for n in closed]
+        if active:
+            files.append((self._path(active, ".csv"), False))
+        return files
+
+    def stats(self):
+        closed, active = self._segments()
+        indexes = [self._index(n) for n in closed]
+        return {
+            "segments": len(closed), "rows": sum(i["rows"] for i in indexes),
+            "compressed_bytes": sum(i["bytes"] for i in indexes),
+            "active_bytes": os.path.getsize(self._path(active, ".csv")) if active else 0,
+            "oldest": indexes[0]["min_time"] if indexes else None,
+        }
+
+
+def _overlaps(entry, start, end):
+    return (start is None or entry["max_time"] >= start) and (end is None or entry["min_time"] <= end)
@@ -1,5 +1,6 @@
+import importlib
+
 import streamlit as st
-from user import render_user_login_page
 
 
 
@@ -11,25 +12,27 @@ st.set_page_config(
 )
 
 from datetime import datetime
-from web import (
-    ParkingDatabase,
-    render_dashboard_page,
-    render_reservation_page,
-    render_admin_login_page
-)
-from admin import (
-    render_analytics_page,
-    render_system_settings_page,
-    render_admin_spot_map,
-    render_user_admin_panel,
-    render_user_passwords_view
-)
+import metrics
+from parking_db import ParkingDatabase
 
 # Cache database
 @st.cache_resource
 def get_db():
+    metrics.start_exporter("web")
     return ParkingDatabase()
 
+# Cached reads, keyed by the store's data version so every session shares
+# one copy until the underlying files change
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_spots(_db, data_dir, version):
+    metrics.inc("smartpark_cache_misses_total", cache="spots")
+    return _db.get_parking_spots()
+
+# Loader bodies only run on a miss, so hits = lookups - misses
+def get_spots(db):
+    metrics.inc("smartpark_cache_lookups_total", cache="spots")
+    return load_spots(db, db.data_dir, db.spots_version())
+
 # Init session state
 def init_session():
     if 'admin_logged_in' not in st.session_state:
@@ -49,13 +52,14 @@ def render_reservation_status_page(db):
         st.session_state.user_plate = plate.upper()
 
     if st.session_state.user_plate:
-        df = db.get_reservations_history()
-        active = df[(df['plate_number'] == st.session_state.user_plate) & (df['status'] == 'active')]
+        db.clean_expired_reservations()
+        # Newest active reservation for the plate, straight from the history index
+        active, _ = db.query_reservations(plate=st.session_state.user_plate, status="active", limit=1)
 
         if active.empty:
             st.info("No active reservation found for this plate.")
         else:
-            res = active.iloc[-1]
+            res = active.iloc[0]
             st.success(f"🅿️ Spot: {res['spot_id']} | 👤 Name: {res['customer_name']}")
 
             end_time = datetime.fromisoformat(res['end_time'])
@@ -99,95 +103,56 @@ def render_admin_spot_grid(spots_df, db):
                             st.success(f"Updated {spot['spot_id']}")
                             st.rerun()
 
-def render_user_admin_panel():
-    from user import UserDatabase
-    st.subheader("👥 User Accounts")
-
-    db = UserDatabase()
-    users_df = db.load_users()
-    st.dataframe(users_df)
-
-    if st.button("🔄 Refresh User List"):
-        st.rerun()
-
-def render_user_passwords_view():
-    from user import UserDatabase
-    st.subheader("🔑 View User Passwords")
-
-    master_key = st.text_input("Enter admin password to reveal users' passwords", type="password")
-    if master_key == "papitxo":
-        db = UserDatabase()
-        df = db.load_users()
-        st.success("Access granted. Below are stored user passwords.")
-        st.dataframe(df[['username', 'password_hash']].rename(columns={"password_hash": "password"}))
-    else:
-        st.info("🔒 Access locked. Enter correct admin key to continue.")
+def page(module, function):
+    """Page render function, imported when the page is first shown.
+
+    Keeps admin-only modules (and plotly behind them) out of the import
+    path of sessions that never open an admin page.
+    """
+    return getattr(importlib.import_module(module), function)
+
+# Page registry: name -> (render function, data it needs, admin only).
+# Data is only loaded for the selected page; render functions receive the db
+# followed by the requested frames in the order listed.
+PAGES = {
+    "🏠 Dashboard": (lambda db, spots: page("web", "render_dashboard_page")(db, spots), ("spots",), False),
+    "🎫 Reservation": (lambda db, spots: page("web", "render_reservation_page")(spots, db), ("spots",), False),
+    "📟 Track Status": (lambda db: render_reservation_status_page(db), (), False),
+    "👤 User Portal": (lambda db: page("user", "render_user_login_page")(), (), False),
+    "🔐 Admin Login": (lambda db: page("web", "render_admin_login_page")(db), (), False),
+    "📊 Analytics": (lambda db: page("admin", "render_analytics_page")(db), (), True),
+    "🔧 System Settings": (lambda db: page("admin", "render_system_settings_page")(db), (), True),
+    "🗺️ Admin Spot Map": (lambda db, spots: page("admin", "render_admin_spot_map")(spots, db), ("spots",), True),
+    "👥 Manage Users": (lambda db: page("admin", "render_user_admin_panel")(), (), True),
+    "🔑 View User Passwords": (lambda db: page("admin", "render_user_passwords_view")(), (), True),
+    "📈 Metrics": (lambda db: page("admin", "render_metrics_page")(), (), True),
+}
+
+DATA_LOADERS = {
+    "spots": get_spots,
+}
 
 
 # App entrypoint
 def main():
     init_session()
     db = get_db()
-    db.clean_expired_reservations()
-    spots_df = db.get_parking_spots()
-    reservations_df = db.get_reservations_history()
-
 
     st.sidebar.title("🧭 SmartPark Navigation")
-    pages = ["🏠 Dashboard",
-             "🎫 Reservation",
-             "📟 Track Status",
-             "👤 User Portal",
-             "🔐 Admin Login"
-             ]
-    if st.session_state.admin_logged_in:
-        pages += ["📊 Analytics",
-                  "🔧 System Settings",
-                  "🗺️ Admin Spot Map",
-                  "👥 Manage Users",
-                  "🔑 View User Passwords"
-                  ]
-
+    pages = [name for name, (_, _, admin_only) in PAGES.items()
+             if not admin_only or st.session_state.admin_logged_in]
     selection = st.sidebar.radio("Choose a page", pages)
 
-    if selection == "🏠 Dashboard":
-        render_dashboard_page(spots_df, reservations_df)
-
-    elif selection == "🎫 Reservation":
-        render_reservation_page(spots_df, db)
-
-    elif selection == "📟 Track Status":
-        render_reservation_status_page(db)
-    elif selection == "📊 Analytics":
-        render_analytics_page(spots_df, reservations_df)
-
-    elif selection == "🔧 System Settings":
-        render_system_settings_page(db)
-
-
-    elif selection == "🗺️ Admin Spot Map":
-        render_admin_spot_map(spots_df, db)
-
-    elif selection == "🔐 Admin Login":
-        render_admin_login_page()
-
-    elif selection == "👤 User Portal":
-        render_user_login_page()
-
-    elif selection == "👥 Manage Users":
-        if st.session_state.get("admin_logged_in", False):
-            render_user_admin_panel()
-
-        else:
-            st.warning("Admins only")
-
-    elif selection == "🔑 View User Passwords":
-        if st.session_state.get("admin_logged_in", False):
-            render_user_passwords_view()
-        else:
-            st.warning("Admins only.")
-
+    render, needs, admin_only = PAGES[selection]
+    if admin_only and not st.session_state.get("admin_logged_in", False):
+        st.warning("Admins only.")
+        return
 
+    with metrics.timer("smartpark_page_render_seconds", page=selection):
+        if needs:
+            # Only a stat() unless a reservation is actually due to expire
+            db.clean_expired_reservations()
+        render(db, *(DATA_LOADERS[name](db) for name in needs))
 
 
 if __name__ == "__main__":
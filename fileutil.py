@@ -0,0 +1,89 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+DATA_DIR_ENV = "SMARTPARK_DATA_DIR"
+
+
+def default_data_dir():
+    """``$SMARTPARK_DATA_DIR`` (the supervisor sets it for every child), else ``parking_data``."""
+    return os.environ.get(DATA_DIR_ENV) or "parking_data"
+
+
+def file_version(path):
+    """(inode, mtime, size) fingerprint; changes whenever the file is rewritten or appended to."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class TrackedFile:
+    """Tells in-place appends to ``path`` apart from the file being replaced.
+
+    Comparing inode numbers alone isn't enough: once a replaced file is
+    freed its inode number can be handed to the next file written. Holding
+    the tracked file open keeps its inode allocated, so ``os.path.samestat``
+    against whatever is at ``path`` now is exact. (Windows can't replace a
+    file that is held open, and has no cross-process locking here anyway, so
+    there only the recorded identity is compared.)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stat = None
+        self._file = None
+
+    def track(self):
+        """Start tracking the file currently at ``path``; returns its stat."""
+        self.close()
+        if fcntl is not None:
+            self._file = open(self.path, "rb")
+            self.stat = os.fstat(self._file.fileno())
+        else:
+            self.stat = os.stat(self.path)
+        return self.stat
+
+    def replaced(self, current=None):
+        """True if ``path`` (or its ``current`` stat) no longer is the tracked file."""
+        if self.stat is None:
+            return True
+        try:
+            return not os.path.samestat(self.stat, current or os.stat(self.path))
+        except FileNotFoundError:
+            return True
+
+    def matches(self, file):
+        """True if the open ``file`` is the tracked file."""
+        return self.stat is not None and os.path.samestat(self.stat, os.fstat(file.fileno()))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.stat = None
+
+
+class FileLock:
+    """flock() on a sidecar file so separate processes serialize their writes."""
+
+    def __init__(self, path, exclusive=True):
+        self.path = path
+        self.exclusive = exclusive
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.file = open(self.path, "a")
+            fcntl.flock(self.file, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
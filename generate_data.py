@@ -0,0 +1,226 @@
+"""Synthesize production-sized SmartPark data directories.
+
+Writes the same files ``ParkingDatabase`` and ``UserDatabase`` use, including
+a ``site_layout.json`` describing the generated lots, so a generated directory
+can be passed straight to either class (or to the benchmark suite) as
+``data_dir``.
+
+    python generate_data.py --out bench_data --spots 5000 --lots 3 \
+        --reservations 2000000 --detections 5000000 --users 50000
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import string
+from datetime import datetime, timedelta
+
+from detection_log import COLUMNS as DETECTION_COLUMNS
+from parking_db import RESERVATION_COLUMNS, SPOT_COLUMNS
+from site_layout import LAYOUT_FILENAME, SiteLayout
+from user_db import USER_COLUMNS
+
+ZONES = ["A", "B", "S", "E"]
+ZONE_WEIGHTS = [0.1, 0.7, 0.15, 0.05]
+ZONE_NAMES = {"A": "VIP", "B": "Regular", "S": "Staff", "E": "Emergency"}
+CAMERAS = ["Gate_North", "Gate_South", "Ramp_L1", "Ramp_L2", "Exit_Main"]
+DURATIONS = [30, 60, 120, 180]
+
+
+# Every generated user can log in with this password
+USER_PASSWORD = "bench123"
+
+SCALES = {
+    "small": dict(spots=40, lots=1, reservations=1_000, detections=10_000, users=100),
+    "medium": dict(spots=2_000, lots=2, reservations=100_000, detections=1_000_000, users=10_000),
+    "large": dict(spots=10_000, lots=4, reservations=2_000_000, detections=10_000_000, users=100_000),
+}
+
+
+def random_plate(rng):
+    letters = ''.join(rng.choices(string.ascii_uppercase, k=3))
+    numbers = ''.join(rng.choices(string.digits, k=4))
+    return f"{letters}{numbers}"
+
+
+def build_layout(rng, count, lots=1):
+    """Site layout with ``count`` spots spread over ``lots`` single-level lots."""
+    config = {"lots": []}
+    for n in range(1, lots + 1):
+        lot_id = f"L{n}" if lots > 1 else "main"
+        lot_count = count // lots + (1 if n <= count % lots else 0)
+        per_zone = {zone: 0 for zone in ZONES}
+        for zone in rng.choices(ZONES, weights=ZONE_WEIGHTS, k=lot_count):
+            per_zone[zone] += 1
+        zones = []
+        y = 1
+        for zone in reversed(ZONES):
+            if not per_zone[zone]:
+                continue
+            per_row = min(per_zone[zone], 50)
+            zones.append({
+                "id": zone, "name": ZONE_NAMES[zone], "spots": per_zone[zone], "origin": [1, y],
+                "per_row": per_row, "prefix": f"{lot_id}-{zone}" if lots > 1 else zone,
+            })
+            y += -(-per_zone[zone] // per_row) + 1
+        config["lots"].append({
+            "id": lot_id, "name": f"Lot {n}",
+            "levels": [{"id": "G", "name": "Ground", "zones": zones}]
+        })
+    return config
+
+
+def generate_spots(rng, layout, now):
+    spots = []
+    for lot in layout.lot_ids:
+        for spot in layout.spots(lot):
+            spot.update({
+                "status": rng.choices(
+                    ["available", "reserved", "occupied", "maintenance"],
+                    weights=[0.55, 0.2, 0.22, 0.03])[0],
+                "plate_number": "", "reserved_by": "", "reserved_until": "",
+                "last_updated": now.isoformat()
+            })
+            spots.append(spot)
+    return spots
+
+
+def write_csv(path, columns, rows):
+    count = 0
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def reservation_rows(rng, spots, plates, count, now, history_days):
+    """Historic reservations are expired; reserved spots get one active row at the end.
+
+    ``created_at`` never decreases down the file (the history index relies on
+    append order), so the history ends where the earliest active row starts.
+    """
+    reserved = [s for s in spots if s["status"] == "reserved"]
+    active = []
+    for spot in reserved:
+        duration = rng.choice(DURATIONS)
+        active.append((now - timedelta(minutes=rng.randrange(duration)), duration, spot))
+    active.sort(key=lambda item: item[0])
+
+    historic = max(count - len(reserved), 0)
+    end_of_history = active[0][0] if active else now
+    start_of_history = end_of_history - timedelta(days=history_days)
+    step = history_days * 86400 / max(historic, 1)
+
+    row_id = 0
+    for i in range(historic):
+        row_id += 1
+        created = start_of_history + timedelta(seconds=i * step + rng.random() * step)
+        duration = rng.choice(DURATIONS)
+        spot = rng.choice(spots)
+        yield [
+            row_id, spot["spot_id"], rng.choice(plates), f"Customer {row_id}",
+            f"customer{row_id}@example.com", f"06{rng.randrange(10**8):08}",
+            created.isoformat(), (created + timedelta(minutes=duration)).isoformat(),
+            duration, "expired", created.isoformat()
+        ]
+
+    for start, duration, spot in active:
+        row_id += 1
+        end = start + timedelta(minutes=duration)
+        plate = rng.choice(plates)
+        name = f"Customer {row_id}"
+        spot.update(plate_number=plate, reserved_by=name, reserved_until=end.isoformat())
+        yield [
+            row_id, spot["spot_id"], plate, name, f"customer{row_id}@example.com",
+            f"06{rng.randrange(10**8):08}", start.isoformat(), end.isoformat(),
+            duration, "active", start.isoformat()
+        ]
+
+
+def detection_rows(rng, plates, count, now, history_days):
+    span = history_days * 86400
+    step = span / max(count, 1)
+    start_of_history = now - timedelta(days=history_days)
+    for i in range(count):
+        seen = start_of_history + timedelta(seconds=i * step)
+        yield [
+            i + 1, rng.choice(plates), round(rng.uniform(0.5, 0.99), 3),
+            seen.strftime("%Y-%m-%d %H:%M:%S"), rng.choice(CAMERAS),
+            False, rng.random() < 0.9
+        ]
+
+
+def user_rows(rng, count, now):
+    password_hash = hashlib.sha256(USER_PASSWORD.encode()).hexdigest()
+    for i in range(count):
+        created = now - timedelta(days=rng.randrange(365))
+        yield [
+            f"user{i:06}", password_hash, rng.randrange(0, 1000),
+            created.isoformat(), (created + timedelta(days=rng.randrange(30))).isoformat()
+        ]
+
+
+def generate(out, spots, reservations, detections, users, lots=1, seed=0, history_days=365):
+    """Write a complete data directory and return the number of rows per file."""
+    rng = random.Random(seed)
+    now = datetime.now()
+    os.makedirs(os.path.join(out, "spots"), exist_ok=True)
+
+    config = build_layout(rng, spots, lots)
+    with open(os.path.join(out, LAYOUT_FILENAME), "w") as file:
+        json.dump(config, file, indent=2)
+    layout = SiteLayout(config)
+
+    plates = [random_plate(rng) for _ in range(max(spots * 5, 100))]
+    spot_rows = generate_spots(rng, layout, now)
+
+    counts = {}
+    counts["reservations_history.csv"] = write_csv(
+        os.path.join(out, "reservations_history.csv"), RESERVATION_COLUMNS,
+        reservation_rows(rng, spot_rows, plates, reservations, now, history_days))
+    for spot in spot_rows:
+        if spot["status"] == "occupied":
+            spot["plate_number"] = rng.choice(plates)
+    counts["spots/*.csv"] = sum(
+        write_csv(os.path.join(out, "spots", f"{lot}.csv"), SPOT_COLUMNS,
+                  ([s[c] for c in SPOT_COLUMNS] for s in spot_rows if s["lot"] == lot))
+        for lot in layout.lot_ids)
+    counts["anpr_detections.csv"] = write_csv(
+        os.path.join(out, "anpr_detections.csv"), DETECTION_COLUMNS,
+        detection_rows(rng, plates, detections, now, history_days))
+    counts["users.csv"] = write_csv(
+        os.path.join(out, "users.csv"), USER_COLUMNS, user_rows(rng, users, now))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default="bench_data", help="target data directory")
+    parser.add_argument("--scale", choices=SCALES, help="preset sizes (individual flags override)")
+    parser.add_argument("--spots", type=int)
+    parser.add_argument("--lots", type=int)
+    parser.add_argument("--reservations", type=int)
+    parser.add_argument("--detections", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--history-days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale or "small"])
+    for key in sizes:
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+
+    counts = generate(args.out, seed=args.seed, history_days=args.history_days, **sizes)
+    for name, rows in counts.items():
+        print(f"{name:<28} {rows:>12,} rows")
+    print(f"Data written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import csv
+import io
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+from fileutil import TrackedFile
+
+BLOCK_BYTES = 8 * 1024 * 1024
+
+
+class ReservationIndex:
+    """Compact in-memory index over ``reservations_history.csv`` for keyset pagination.
+
+    Only what is needed to find a page stays resident, in typed arrays with
+    one entry per row in file order (which is ``id`` and ``created_at``
+    order): the id, ``created_at`` in microseconds, the row's byte offset,
+    and for each of plate, spot and status a small integer code plus the
+    sorted row positions holding each code. A filtered page is found by
+    bisecting one position list; its rows are then read from the file at
+    their offsets.
+
+    The history file is only ever appended to in place; any other change
+    replaces it. Appends are indexed incrementally from the last consumed
+    byte, and a replaced file (see ``fileutil.TrackedFile``) triggers a full
+    rebuild.
+    """
+
+    INDEXED = ("plate_number", "spot_id", "status")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = TrackedFile(path)
+        self._size = None
+        self._offset = 0
+        self._columns = None
+        self._line_count = None  # (bytes counted, records, quote parity) for count() before a load
+        self._reset()
+
+    def _reset(self):
+        self._ids = array("q")
+        self._max_id = 0
+        self._created = array("q")
+        self._created_sorted = True  # False once a row is older than the one before it
+        self._offsets = array("q")
+        self._codes = {column: array("i") for column in self.INDEXED}
+        self._vocab = {column: {} for column in self.INDEXED}      # value -> code
+        self._positions = {column: [] for column in self.INDEXED}  # code -> array of row positions
+
+    # ---- Loading ----
+    def _load(self):
+        self._reset()
+        self._file.track()
+        with open(self.path, "rb") as file:
+            header = file.readline()
+        self._columns = next(csv.reader([header.decode()]))
+        self._offset = self._scan(len(header))
+
+    def _scan(self, start):
+        """Index the complete rows from byte ``start`` on; returns the end of the last one."""
+        with open(self.path, "rb") as file:
+            if not self._file.matches(file):
+                return start  # replaced meanwhile; the next refresh rebuilds
+            file.seek(start)
+            carry, base = b"", start
+            while True:
+                block = file.read(BLOCK_BYTES)
+                if not block:
+                    return base
+                data = carry + block
+                ends = _record_ends(data)
+                if not len(ends):
+                    carry = data
+                    continue
+                cut = int(ends[-1]) + 1
+                self._add_rows(data[:cut], base, ends)
+                carry, base = data[cut:], base + cut
+
+    def _add_rows(self, data, base, ends):
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=self._columns, dtype=str,
+                            keep_default_na=False, skip_blank_lines=False,
+                            usecols=["id", "created_at", *self.INDEXED])
+        starts = np.concatenate(([0], ends[:-1] + 1)) + base
+        self._offsets.frombytes(starts.astype(np.int64).tobytes())
+
+        ids = pd.to_numeric(frame["id"], errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+        self._ids.frombytes(ids.tobytes())
+        self._max_id = max(self._max_id, int(ids.max()))
+        created = pd.to_datetime(frame["created_at"], format="ISO8601", errors="coerce")
+        created = created.to_numpy(dtype="datetime64[us]").astype(np.int64)  # NaT is the minimum
+        if self._created_sorted:
+            self._created_sorted = bool((np.diff(created) >= 0).all()) and (
+                not len(self._created) or created[0] >= self._created[-1])
+        self._created.frombytes(created.tobytes())
+
+        first = len(self._ids) - len(frame)
+        for column in self.INDEXED:
+            vocab, positions, codes = self._vocab[column], self._positions[column], self._codes[column]
+            for pos, value in enumerate(frame[column].tolist(), first):
+                code = vocab.get(value)
+                if code is None:
+                    code = vocab[value] = len(positions)
+                    positions.append(array("i"))
+                codes.append(code)
+                positions[code].append(pos)
+
+    def refresh(self):
+        """Bring the index up to date with the file; cheap (one stat) when nothing changed."""
+        with self._lock:
+            stat = os.stat(self.path)
+            if self._columns is None or self._file.replaced(stat) or stat.st_size < self._offset:
+                self._load()
+            elif stat.st_size != self._size:
+                self._offset = self._scan(self._offset)
+            self._size = stat.st_size
+
+    def _read_rows(self, positions):
+        """Frame of the given row positions read from the file, or None if it was replaced."""
+        if not positions:
+            return pd.DataFrame(columns=self._columns)
+        with open(self.path, "rb") as file:
+            if not self._file.matches(file):
+                return None
+            chunks = []
+            for pos in positions:
+                start = self._offsets[pos]
+                end = self._offsets[pos + 1] if pos + 1 < len(self._offsets) else self._offset
+                file.seek(start)
+                chunks.append(file.read(end - start))
+        frame = pd.read_csv(io.BytesIO(b"".join(chunks)), header=None, names=self._columns,
+                            dtype=str, keep_default_na=False, skip_blank_lines=False)
+        frame.index = positions
+        return frame
+
+    # ---- Queries ----
+    def next_id(self):
+        self.refresh()
+        return self._max_id + 1
+
+    def __len__(self):
+        self.refresh()
+        return len(self._ids)
+
+    def count(self):
+        """Row count; counts records incrementally instead of building the index if it isn't loaded."""
+        if self._columns is not None:
+            return len(self)
+        with self._lock:
+            while True:
+                try:
+                    stat = os.stat(self.path)
+                except FileNotFoundError:
+                    return 0
+                offset, records, parity = self._line_count or (0, 0, 0)
+                if self._line_count is None or self._file.replaced(stat) or stat.st_size < offset:
+                    offset, records, parity = 0, 0, 0
+                    self._file.track()
+                with open(self.path, "rb") as file:
+                    if not self._file.matches(file):
+                        self._line_count = None
+                        continue  # replaced between track() and open(); start over
+                    file.seek(offset)
+                    while True:
+                        block = file.read(BLOCK_BYTES)
+                        if not block:
+                            break
+                        records += len(_record_ends(block, parity))
+                        parity = (parity + block.count(b'"')) & 1
+                        offset += len(block)
+                self._line_count = (offset, records, parity)
+                return max(0, records - 1)  # header
+
+    def query(self, plate=None, spot_id=None, status=None, start=None, end=None,
+              after=None, limit=50, descending=True):
+        """One page of reservations matching every given filter.
+
+        ``start``/``end`` bound ``created_at`` (ISO strings or datetimes,
+        inclusive). ``after`` is the cursor returned by the previous page:
+        the ``id`` of its last row. Returns ``(page frame, next cursor)``;
+        the cursor is None on the last page.
+        """
+        while True:
+            self.refresh()
+            with self._lock:
+                picked, next_cursor = self._pick(plate, spot_id, status, start, end, after, limit, descending)
+                rows = self._read_rows(picked)
+            if rows is not None:
+                return rows, next_cursor
+            # The file was rewritten between refresh and read; index it again
+
+    def _pick(self, plate, spot_id, status, start, end, after, limit, descending):
+        # Row-position window from the date range and the cursor. Bisecting
+        # created_at needs it in file order; otherwise each row is checked.
+        lo, hi = 0, len(self._ids)
+        window = None
+        if start is not None or end is not None:
+            low = _micros(start) if start is not None else None
+            high = _micros(end) if end is not None else None
+            if self._created_sorted:
+                if low is not None:
+                    lo = max(lo, bisect_left(self._created, low))
+                if high is not None:
+                    hi = min(hi, bisect_right(self._created, high))
+            else:
+                window = (low, high)
+        if after is not None:
+            if descending:
+                hi = min(hi, bisect_left(self._ids, int(after)))
+            else:
+                lo = max(lo, bisect_right(self._ids, int(after)))
+
+        filters = {c: v for c, v in zip(self.INDEXED, (plate, spot_id, status)) if v}
+        if filters or window:
+            codes = {c: self._vocab[c].get(v) for c, v in filters.items()}
+            if None in codes.values():
+                return [], None
+            if codes:
+                # Walk the most selective position list, check the other filters per row
+                lists = {c: self._positions[c][code] for c, code in codes.items()}
+                driver_column = min(lists, key=lambda c: len(lists[c]))
+                driver = lists[driver_column]
+                a, b = bisect_left(driver, lo), bisect_left(driver, hi)
+            else:
+                driver_column, driver, a, b = None, None, lo, hi
+            checks = [(self._codes[c], code) for c, code in codes.items() if c != driver_column]
+            picked = []
+            for i in (reversed(range(a, b)) if descending else range(a, b)):
+                pos = driver[i] if driver is not None else i
+                if not all(row_codes[pos] == code for row_codes, code in checks):
+                    continue
+                if window and not _within(self._created[pos], *window):
+                    continue
+                picked.append(pos)
+                if len(picked) > limit:
+                    break
+        elif descending:
+            picked = list(range(hi - 1, max(lo, hi - limit - 1) - 1, -1))
+        else:
+            picked = list(range(lo, min(hi, lo + limit + 1)))
+
+        has_more = len(picked) > limit
+        picked = picked[:limit]
+        next_cursor = self._ids[picked[-1]] if has_more and picked else None
+        return picked, next_cursor
+
+
+def _record_ends(data, parity=0):
+    """Positions of the newlines in ``data`` that end a CSV record (not inside quotes).
+
+    ``parity`` is 1 when ``data`` starts inside a quoted field.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == 10)
+    if not parity and b'"' not in data:
+        return newlines
+    # uint8 wraps at 256, which keeps the parity of the running quote count
+    quotes = np.cumsum(buffer == 34, dtype=np.uint8) + np.uint8(parity)
+    return newlines[(quotes[newlines] & 1) == 0]
+
+
+def _within(value, low, high):
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def _micros(value):
+    return int(np.datetime64(pd.Timestamp(value).to_datetime64(), "us").astype(np.int64))
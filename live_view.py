@@ -0,0 +1,208 @@
+"""Optional live MJPEG view of an ANPR camera.
+
+The detector hands every processed frame to ``LiveView.publish``. While
+nobody is watching that call returns immediately, so a headless detector
+does no drawing or encoding at all. Once a client connects, frames are
+picked up at most ``max_fps`` times per second, and annotation and JPEG
+encoding run on the view's own thread, never on the inference loop.
+
+    GET /stream.mjpg     multipart/x-mixed-replace stream (embed in an <img>)
+    GET /snapshot.jpg    the next encoded frame
+    GET /health          subscriber count and frames encoded
+
+Each running view registers itself in ``<data_dir>/run/live/<camera>.json``
+so the dashboard can list the cameras it can embed. The stream has no
+authentication, so it binds to localhost unless a host is given
+explicitly (e.g. ``--live-host 0.0.0.0`` on a trusted network).
+"""
+import json
+import os
+import threading
+import time
+
+from fileutil import default_data_dir
+
+LIVE_DIR = os.path.join(default_data_dir(), "run", "live")
+BOUNDARY = b"smartparkframe"
+
+
+def annotate(frame, detections):
+    """Draw car/plate boxes and plate text onto ``frame`` in place."""
+    import cv2
+
+    for detection in detections:
+        car_box, plate_box = detection['car_box'], detection['plate_box']
+        cv2.rectangle(frame, (car_box[0], car_box[1]), (car_box[2], car_box[3]), (0, 255, 0), 2)
+        cv2.rectangle(frame, (plate_box[0], plate_box[1]), (plate_box[2], plate_box[3]), (0, 0, 255), 2)
+        cv2.putText(frame, f"{detection['plate_text']} ({detection['confidence']:.2f})",
+                    (plate_box[0], plate_box[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    return frame
+
+
+class LiveView:
+    def __init__(self, camera, port, host="127.0.0.1", max_fps=5, quality=70, live_dir=LIVE_DIR):
+        self.camera = camera
+        self.port = port
+        self.host = host
+        self.min_interval = 1.0 / max_fps
+        self.quality = quality
+        self.registration = os.path.join(live_dir, f"{camera}.json")
+        self.subscribers = 0
+        self.frames_encoded = 0
+        self._pending = None          # (frame, detections) waiting for the encoder
+        self._last_publish = 0.0
+        self._jpeg = None
+        self._jpeg_seq = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._server = None
+
+    # ---- Inference side ----
+    def publish(self, frame, detections):
+        """Offer a processed frame; a no-op unless someone is watching."""
+        if not self.subscribers:
+            return
+        now = time.monotonic()
+        if now - self._last_publish < self.min_interval:
+            return
+        self._last_publish = now
+        with self._cond:
+            # The capture loop hands over a fresh array per frame, so no copy here;
+            # a frame the encoder hasn't reached yet is simply replaced
+            self._pending = (frame, detections)
+            self._cond.notify_all()
+
+    # ---- Encoder thread ----
+    def _encode_loop(self):
+        import cv2
+
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+        while self._running:
+            with self._cond:
+                while self._running and self._pending is None:
+                    self._cond.wait(timeout=1)
+                if not self._running:
+                    return
+                frame, detections = self._pending
+                self._pending = None
+            ok, jpeg = cv2.imencode(".jpg", annotate(frame.copy(), detections), params)
+            if not ok:
+                continue
+            with self._cond:
+                self._jpeg = jpeg.tobytes()
+                self._jpeg_seq += 1
+                self.frames_encoded += 1
+                self._cond.notify_all()
+
+    def next_jpeg(self, after_seq, timeout=5):
+        """Block until a frame newer than ``after_seq`` is encoded; returns ``(seq, bytes)``."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._jpeg_seq > after_seq or not self._running, timeout=timeout)
+            return self._jpeg_seq, self._jpeg
+
+    def _subscribe(self, delta):
+        with self._cond:
+            self.subscribers += delta
+
+    # ---- HTTP ----
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+        view = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/stream.mjpg":
+                    self.stream()
+                elif path == "/snapshot.jpg":
+                    self.snapshot()
+                elif path == "/health":
+                    body = json.dumps({"camera": view.camera, "subscribers": view.subscribers,
+                                       "frames_encoded": view.frames_encoded}).encode()
+                    self.reply(200, "application/json", body)
+                else:
+                    self.send_error(404)
+
+            def reply(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def snapshot(self):
+                view._subscribe(1)
+                try:
+                    seq, jpeg = view.next_jpeg(view._jpeg_seq)
+                finally:
+                    view._subscribe(-1)
+                if jpeg is None:
+                    self.send_error(503, "No frame available yet")
+                else:
+                    self.reply(200, "image/jpeg", jpeg)
+
+            def stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY.decode()}")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                view._subscribe(1)
+                seq = 0
+                try:
+                    while view._running:
+                        new_seq, jpeg = view.next_jpeg(seq)
+                        if new_seq == seq or jpeg is None:
+                            continue
+                        seq = new_seq
+                        self.wfile.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n"
+                                         + f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    view._subscribe(-1)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    # ---- Lifecycle ----
+    def start(self):
+        from http.server import ThreadingHTTPServer
+
+        self._running = True
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="live-http", daemon=True).start()
+        threading.Thread(target=self._encode_loop, name="live-encoder", daemon=True).start()
+        os.makedirs(os.path.dirname(self.registration), exist_ok=True)
+        with open(self.registration, "w") as file:
+            json.dump({"camera": self.camera, "port": self.port, "pid": os.getpid()}, file)
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+        if os.path.exists(self.registration):
+            os.remove(self.registration)
+
+
+def live_cameras(live_dir=LIVE_DIR):
+    """Registrations of running live views whose process is still alive."""
+    cameras = []
+    if not os.path.isdir(live_dir):
+        return cameras
+    for filename in sorted(os.listdir(live_dir)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(live_dir, filename)) as file:
+                registration = json.load(file)
+            os.kill(registration["pid"], 0)
+        except (OSError, ValueError, KeyError):
+            continue  # stale file from a detector that didn't shut down cleanly
+        cameras.append(registration)
+    return cameras
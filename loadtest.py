@@ -0,0 +1,215 @@
+"""Load test for the SmartPark HTTP API (``api.py``).
+
+Opens ``--connections`` keep-alive connections to a running instance and
+sends a weighted mix of plate lookups, availability checks, spot claims and
+detection batches for ``--duration`` seconds, then reports requests/s and
+p50/p95/p99/max latency per endpoint.
+
+    python api.py --data-dir bench_data &
+    python loadtest.py --url http://127.0.0.1:8000 --connections 32 --duration 20
+
+    python loadtest.py --spawn --scale small       # generate data and start a local instance
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+import generate_data
+from benchmark import percentile
+
+# endpoint -> weight
+DEFAULT_MIX = {
+    "plate_lookup": 50,
+    "availability": 30,
+    "spot": 10,
+    "reserve": 5,
+    "detections": 5,
+}
+
+
+class Connection:
+    """Minimal HTTP/1.1 keep-alive client; the API always sends Content-Length."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode() if payload is not None else b""
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        status = int(status_line.split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        await self.reader.readexactly(length)
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def build_requests(spot_ids, plates, rng):
+    """Return ``{endpoint: callable() -> (method, path, payload)}``."""
+    return {
+        "plate_lookup": lambda: ("GET", f"/plates/{rng.choice(plates)}", None),
+        "availability": lambda: ("GET", "/availability", None),
+        "spot": lambda: ("GET", f"/spots/{rng.choice(spot_ids)}", None),
+        "reserve": lambda: ("POST", "/reservations", {
+            "spot_id": rng.choice(spot_ids), "plate_number": generate_data.random_plate(rng),
+            "name": "Load Test", "email": "load@example.com", "phone": "0600000000",
+            "duration": rng.choice(generate_data.DURATIONS)}),
+        "detections": lambda: ("POST", "/detections", {"detections": [
+            {"plate_number": rng.choice(plates), "confidence": round(rng.uniform(0.5, 1), 3),
+             "camera_location": rng.choice(generate_data.CAMERAS)} for _ in range(10)]}),
+    }
+
+
+async def worker(host, port, requests, names, weights, deadline, samples, errors, rng):
+    conn = Connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(names, weights)[0]
+            method, path, payload = requests[endpoint]()
+            start = time.perf_counter()
+            try:
+                status = await conn.request(method, path, payload)
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                conn.close()
+                errors[endpoint] = errors.get(endpoint, 0) + 1
+                continue
+            samples.setdefault(endpoint, []).append((time.perf_counter() - start) * 1000)
+            # 409 is the expected answer to claiming a taken spot
+            if status >= 400 and status != 409:
+                errors[endpoint] = errors.get(endpoint, 0) + 1
+    finally:
+        conn.close()
+
+
+def fetch_json(url):
+    with urlopen(url, timeout=5) as response:
+        return json.load(response)
+
+
+async def run(url, connections, duration, mix, seed):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    spots = fetch_json(f"{url}/spots")["spots"]
+    spot_ids = [s["spot_id"] for s in spots]
+    rng = random.Random(seed)
+    plates = [generate_data.random_plate(rng) for _ in range(1000)]
+    plates += [s["plate_number"] for s in spots if s["plate_number"]]
+
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    samples, errors = {}, {}
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        worker(host, port, build_requests(spot_ids, plates, random.Random(seed + i)),
+               names, weights, deadline, samples, errors, random.Random(seed + i))
+        for i in range(connections)
+    ))
+    elapsed = time.perf_counter() - start
+    return report(samples, errors, elapsed, connections)
+
+
+def report(samples, errors, elapsed, connections):
+    total = sum(len(s) for s in samples.values())
+    results = {"connections": connections, "seconds": elapsed,
+               "requests": total, "requests_per_s": total / elapsed, "endpoints": {}}
+    print(f"{total:,} requests in {elapsed:.1f} s over {connections} connections: "
+          f"{total / elapsed:,.0f} req/s")
+    for endpoint in sorted(samples):
+        s = samples[endpoint]
+        stats = {
+            "requests": len(s), "errors": errors.get(endpoint, 0),
+            "requests_per_s": len(s) / elapsed,
+            "p50_ms": percentile(s, 50), "p95_ms": percentile(s, 95),
+            "p99_ms": percentile(s, 99), "max_ms": max(s),
+        }
+        results["endpoints"][endpoint] = stats
+        print(f"  {endpoint:<14} {stats['requests_per_s']:>8.0f} req/s"
+              f"  p50 {stats['p50_ms']:>7.2f} ms  p95 {stats['p95_ms']:>7.2f} ms"
+              f"  p99 {stats['p99_ms']:>7.2f} ms  max {stats['max_ms']:>8.2f} ms"
+              f"  errors {stats['errors']}")
+    return results
+
+
+def wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            return fetch_json(f"{url}/health")
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"API at {url} did not become ready in {timeout} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--mix", type=json.loads, default=DEFAULT_MIX,
+                        help='endpoint weights as JSON, e.g. \'{"plate_lookup": 1}\'')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spawn", action="store_true", help="start a local api.py instance first")
+    parser.add_argument("--scale", default="small", choices=list(generate_data.SCALES),
+                        help="data generated for --spawn when --data-dir isn't given")
+    parser.add_argument("--data-dir", help="data directory for --spawn")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    server = data_dir = None
+    if args.spawn:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = tempfile.mkdtemp(prefix=f"smartpark_api_{args.scale}_")
+            print(f"Generating {args.scale} data into {data_dir}")
+            generate_data.generate(data_dir, seed=args.seed, **generate_data.SCALES[args.scale])
+        port = urlsplit(args.url).port or 8000
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__) or ".", "api.py"),
+                                   "--data-dir", data_dir, "--port", str(port)])
+    try:
+        wait_ready(args.url)
+        results = asyncio.run(run(args.url, args.connections, args.duration, args.mix, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            if args.data_dir is None:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {os.path.abspath(args.json)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""Lightweight timing, counter and gauge instrumentation.
+
+Disabled unless ``SMARTPARK_METRICS=1`` is set in the environment (or
+``enable()`` is called before the instrumented modules are imported). While
+disabled, ``timed`` returns the decorated function untouched and every other
+call returns immediately, so instrumented hot paths cost next to nothing.
+
+Metrics are exported in the Prometheus text format, written periodically
+to ``<metrics dir>/<process>.prom`` by ``start_exporter``.
+
+    @metrics.timed("smartpark_db_seconds", op="add_reservation")
+    def add_reservation(...): ...
+
+    with metrics.timer("smartpark_anpr_stage_seconds", stage="ocr"):
+        ...
+    metrics.inc("smartpark_anpr_frames_total", camera="Gate_1")
+    metrics.set_gauge("smartpark_active_reservations", 12)
+"""
+import functools
+import os
+import threading
+import time
+
+from fileutil import default_data_dir
+
+ENABLED = os.environ.get("SMARTPARK_METRICS", "").lower() in ("1", "true", "yes")
+METRICS_DIR = os.path.join(default_data_dir(), "metrics")
+
+# Seconds; covers sub-millisecond storage calls up to multi-second inference
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_gauges = {}      # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# ---- Recording ----
+def inc(name, value=1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    if not ENABLED:
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def add_gauge(name, delta, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def observe(name, seconds, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+        hist[-2] += seconds
+        hist[-1] += 1
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """Context manager observing the elapsed time of its block."""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator observing each call's duration; a no-op when metrics are disabled."""
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+# ---- Export ----
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus():
+    """All recorded metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((k, list(v)) for k, v in _histograms.items())
+
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        header(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), value in gauges:
+        header(name, "gauge")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), hist in histograms:
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(DEFAULT_BUCKETS, hist):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {hist[-1]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as file:
+        file.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+_exporters = {}
+
+
+def start_exporter(process, interval=10, metrics_dir=METRICS_DIR):
+    """Write ``<metrics_dir>/<process>.prom`` every ``interval`` seconds from a daemon thread."""
+    if not ENABLED or process in _exporters:
+        return
+    os.makedirs(metrics_dir, exist_ok=True)
+    path = os.path.join(metrics_dir, f"{process}.prom")
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            export(path)
+
+    thread = threading.Thread(target=loop, name=f"metrics-{process}", daemon=True)
+    thread.start()
+    _exporters[process] = stop
+
+
+def read_exports(metrics_dir=METRICS_DIR):
+    """``{process: prometheus text}`` for every exported file, for the admin page."""
+    exports = {}
+    if os.path.isdir(metrics_dir):
+        for filename in sorted(os.listdir(metrics_dir)):
+            if filename.endswith(".prom"):
+                with open(os.path.join(metrics_dir, filename)) as file:
+                    exports[filename[:-5]] = file.read()
+    return exports
+
+
+# ---- Reading exports ----
+def _parse_labels(text):
+    labels = {}
+    for part in text.split('",'):
+        if "=" in part:
+            key, value = part.split("=", 1)
+            labels[key.strip()] = value.strip().strip('"').replace('\\"', '"').replace("\\\\", "\\")
+    return labels
+
+
+def parse_prometheus(text):
+    """Samples of an exposition as ``(name, labels dict, value)`` tuples (comments skipped)."""
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name, _, labels = series.partition("{")
+        samples.append((name, _parse_labels(labels.rstrip("}")), float(value)))
+    return samples
+
+
+def _bucket_quantile(buckets, count, q):
+    """Upper bound of the bucket holding quantile ``q`` (cumulative buckets)."""
+    target = q * count
+    for bound, cumulative in buckets:
+        if cumulative >= target:
+            return bound
+    return float("inf")
+
+
+def summarize(text):
+    """Split an exposition into plain series and per-series histogram summaries.
+
+    Returns ``(series, histograms)``: ``series`` is a list of
+    ``{"metric", "labels", "value"}`` for counters and gauges; each histogram
+    entry has ``count``, ``mean`` and bucket-bound ``p50``/``p95``/``p99``.
+    """
+    series, histograms = [], {}
+    for name, labels, value in parse_prometheus(text):
+        if name.endswith(("_bucket", "_sum", "_count")):
+            base, suffix = name.rsplit("_", 1)
+            le = labels.pop("le", None)
+            key = (base, tuple(sorted(labels.items())))
+            entry = histograms.setdefault(key, {"buckets": [], "sum": 0.0, "count": 0})
+            if suffix == "bucket":
+                entry["buckets"].append((float(le), value))
+            else:
+                entry[suffix] = value
+        else:
+            series.append({"metric": name, "labels": _label_text(labels), "value": value})
+
+    summaries = []
+    for (name, labels), entry in sorted(histograms.items()):
+        count = int(entry["count"])
+        buckets = sorted(entry["buckets"])
+        summaries.append({
+            "metric": name, "labels": _label_text(dict(labels)), "count": count,
+            "mean": entry["sum"] / count if count else 0.0,
+            **{f"p{int(q * 100)}": _bucket_quantile(buckets, count, q) if count else 0.0
+               for q in (0.5, 0.95, 0.99)},
+        })
+    return series, summaries
+
+
+def _label_text(labels):
+    return ", ".join(f"{k}={v}" for k, v in sorted(labels.items()))
@@ -0,0 +1,512 @@
+import pandas as pd
+from datetime import datetime, timedelta
+import csv
+import hashlib
+import os
+import threading
+
+import metrics
+from changefeed import ChangeFeed
+from detection_log import COLUMNS as DETECTION_COLUMNS, DetectionLog
+from fileutil import FileLock, default_data_dir, file_version
+from history_index import ReservationIndex
+from rollups import RollupEngine, duration_bucket
+from site_layout import load_site_layout
+
+SPOT_COLUMNS = [
+    'spot_id', 'lot', 'level', 'zone', 'status', 'plate_number', 'reserved_by',
+    'reserved_until', 'last_updated', 'x', 'y'
+]
+SPOT_TEXT_COLUMNS = ['spot_id', 'lot', 'level', 'zone', 'status', 'plate_number',
+                     'reserved_by', 'reserved_until', 'last_updated']
+SPOT_STATE_COLUMNS = ['status', 'plate_number', 'reserved_by', 'reserved_until', 'last_updated']
+RESERVATION_COLUMNS = [
+    'id', 'spot_id', 'plate_number', 'customer_name', 'customer_email',
+    'customer_phone', 'start_time', 'end_time', 'duration_minutes',
+    'status', 'created_at'
+]
+
+
+def apply_spot_changes(spots_df, events):
+    """Apply change-feed events to a spots frame.
+
+    Returns the updated frame (the input itself if no spot changed), or None
+    when a lot was reset and the caller should reload instead.
+    """
+    latest = {}
+    for event in events:
+        if event["type"] == "spots_reset":
+            return None
+        if event["type"] == "spot":
+            latest[event["spot_id"]] = event
+    if not latest:
+        return spots_df
+
+    df = spots_df.copy()
+    positions = pd.Series(range(len(df)), index=df['spot_id'])
+    columns = [df.columns.get_loc(c) for c in SPOT_STATE_COLUMNS]
+    for spot_id, event in latest.items():
+        if spot_id in positions.index:
+            row = positions[spot_id]
+            for col, name in zip(columns, SPOT_STATE_COLUMNS):
+                df.iat[row, col] = event[name]
+    return df
+
+
+class SpotUnavailable(ValueError):
+    """Raised by ``add_reservation(require_available=True)`` when the spot is already taken."""
+
+    def __init__(self, spot_id, status):
+        super().__init__(f"Spot {spot_id} is {status}")
+        self.spot_id = spot_id
+        self.status = status
+
+
+# ==== Database Class ====
+class ParkingDatabase:
+    """CSV-backed parking store.
+
+    Spot state is sharded per lot (``spots/<lot>.csv``) following the site
+    layout, so updating a spot only rewrites the rows of its own lot. Every
+    spot method takes an optional ``lot``; leaving it out spans all lots.
+
+    Each write is also published on ``self.changes`` so views can refresh
+    from deltas instead of re-reading the files. Writes take a file lock per
+    shard and one for the reservation history, so the web app, the API and
+    the detectors can share a data directory.
+    """
+
+    def __init__(self, data_dir=None, layout=None):
+        self.data_dir = data_dir = data_dir or default_data_dir()
+        self.layout = layout or load_site_layout(data_dir=data_dir)
+        self.spots_dir = os.path.join(data_dir, "spots")
+        # Pre-layout single-file spot table; migrated into the lot shards on init
+        self.parking_spots_file = os.path.join(data_dir, "parking_spots.csv")
+        self.reservations_file = os.path.join(data_dir, "reservations_history.csv")
+        self.emergency_vehicles_file = os.path.join(data_dir, "emergency_vehicles.csv")
+        self.admin_users_file = os.path.join(data_dir, "admin_users.csv")
+        # Pre-log single-file detection table; migrated into the detection log on init
+        self.anpr_detections_file = os.path.join(data_dir, "anpr_detections.csv")
+        self.detections = DetectionLog.open(data_dir)
+        self._lot_locks = {lot: threading.Lock() for lot in self.layout.lot_ids}
+        self.rollups = RollupEngine(os.path.join(data_dir, "rollups"))
+        self._history = ReservationIndex(self.reservations_file)
+        self._reservations_lock = threading.Lock()
+        self.changes = ChangeFeed(os.path.join(data_dir, "changes.log"))
+        # (reservations version, earliest active end_time) after the last full expiry sweep
+        self._expiry_state = None
+        self.init_database()
+
+    def init_database(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        needs_rollups = not self.rollups.exists()
+        os.makedirs(self.spots_dir, exist_ok=True)
+        missing = [lot for lot in self.layout.lot_ids if not os.path.exists(self.spots_file(lot))]
+        if missing and os.path.exists(self.parking_spots_file):
+            self._migrate_legacy_spots(missing)
+        for lot in missing:
+            if not os.path.exists(self.spots_file(lot)):
+                self.initialize_parking_spots(lot)
+        if not os.path.exists(self.reservations_file):
+            pd.DataFrame(columns=RESERVATION_COLUMNS).to_csv(self.reservations_file, index=False)
+        if not os.path.exists(self.emergency_vehicles_file):
+            pd.DataFrame([{ "plate_number": "AMB001", "vehicle_type": "Ambulance",
+                "description": "City Hospital", "is_active": True,
+                "added_date": datetime.now().isoformat()
+            }]).to_csv(self.emergency_vehicles_file, index=False)
+        if not os.path.exists(self.admin_users_file):
+            hash_ = hashlib.sha256("admin123".encode()).hexdigest()
+            pd.DataFrame([{
+                "username": "admin", "password_hash": hash_, "email": "admin@smartpark.com",
+                "role": "super_admin", "created_at": datetime.now().isoformat(), "last_login": ""
+            }]).to_csv(self.admin_users_file, index=False)
+        if os.path.exists(self.anpr_detections_file) and not self.detections.segment_files():
+            self._migrate_legacy_detections()
+        if needs_rollups:
+            self.rebuild_rollups()
+
+    # ---- Data versions ----
+    def spots_version(self, lot=None):
+        return tuple(file_version(self.spots_file(l)) for l in ([lot] if lot else self.layout.lot_ids))
+
+    def reservations_version(self):
+        return file_version(self.reservations_file)
+
+    # ---- Spot shards ----
+    def spots_file(self, lot):
+        return os.path.join(self.spots_dir, f"{lot}.csv")
+
+    def lots(self):
+        return self.layout.lot_ids
+
+    def _layout_frame(self, lot):
+        now = datetime.now().isoformat()
+        df = pd.DataFrame(self.layout.spots(lot))
+        df['status'] = 'available'
+        df['plate_number'] = ''
+        df['reserved_by'] = ''
+        df['reserved_until'] = ''
+        df['last_updated'] = now
+        return df[SPOT_COLUMNS]
+
+    def _write_shard(self, lot, df):
+        # Write-then-rename so readers never see a half-written shard
+        path = self.spots_file(lot)
+        tmp = f"{path}.tmp"
+        df[SPOT_COLUMNS].to_csv(tmp, index=False)
+        os.replace(tmp, path)
+        metrics.inc("smartpark_db_rows_written_total", len(df), table="spots")
+
+    def _read_shard(self, lot):
+        df = pd.read_csv(
+            self.spots_file(lot),
+            dtype={c: str for c in SPOT_TEXT_COLUMNS},
+            keep_default_na=False
+        )
+        metrics.inc("smartpark_db_rows_read_total", len(df), table="spots")
+        return df
+
+    def _migrate_legacy_spots(self, lots):
+        legacy = pd.read_csv(self.parking_spots_file, dtype=str, keep_default_na=False)
+        state = legacy.set_index('spot_id')
+        for lot in lots:
+            df = self._layout_frame(lot)
+            known = df['spot_id'].isin(state.index)
+            for col in ['status', 'plate_number', 'reserved_by', 'reserved_until', 'last_updated']:
+                if col in state.columns:
+                    df.loc[known, col] = df.loc[known, 'spot_id'].map(state[col])
+            self._write_shard(lot, df)
+
+    def _shard_lock(self, lot):
+        return FileLock(f"{self.spots_file(lot)}.lock")
+
+    def _reservations_file_lock(self):
+        return FileLock(f"{self.reservations_file}.lock")
+
+    def _lot_for_spot(self, spot_id, lot=None):
+        """Lot holding ``spot_id``; a ``lot`` passed by the caller must agree with the layout."""
+        spot_lot = self.layout.lot_of(spot_id)
+        if spot_lot is None:
+            raise KeyError(f"Unknown spot: {spot_id}")
+        if lot and lot != spot_lot:
+            raise KeyError(f"Spot {spot_id} is in lot {spot_lot}, not {lot}")
+        return spot_lot
+
+    @metrics.timed("smartpark_db_seconds", op="initialize_parking_spots")
+    def initialize_parking_spots(self, lot=None):
+        for lot_id in ([lot] if lot else self.layout.lot_ids):
+            with self._lot_locks[lot_id], self._shard_lock(lot_id):
+                df = self._layout_frame(lot_id)
+                self._write_shard(lot_id, df)
+            self.rollups.set_status_counts(lot_id, df.groupby(['zone', 'status']).size().to_dict())
+            self.changes.emit([{"type": "spots_reset", "lot": lot_id}])
+
+    @metrics.timed("smartpark_db_seconds", op="get_parking_spots")
+    def get_parking_spots(self, lot=None):
+        if lot:
+            return self._read_shard(lot)
+        return pd.concat([self._read_shard(l) for l in self.layout.lot_ids], ignore_index=True)
+
+    @metrics.timed("smartpark_db_seconds", op="get_reservations_history")
+    def get_reservations_history(self, lot=None):
+        try:
+            df = pd.read_csv(self.reservations_file)
+        except:
+            return pd.DataFrame()
+        metrics.inc("smartpark_db_rows_read_total", len(df), table="reservations")
+        if lot:
+            lot_spots = {s['spot_id'] for s in self.layout.spots(lot)}
+            df = df[df['spot_id'].isin(lot_spots)]
+        return df
+
+    @metrics.timed("smartpark_db_seconds", op="query_reservations")
+    def query_reservations(self, plate=None, spot_id=None, status=None, start=None, end=None,
+                           after=None, limit=50, descending=True):
+        """One page of reservation history, newest first by default.
+
+        Filters combine with AND; ``start``/``end`` bound ``created_at``.
+        Pass the returned cursor as ``after`` to get the next page. Returns
+        ``(page DataFrame, next cursor or None)``.
+        """
+        page, cursor = self._history.query(plate=plate, spot_id=spot_id, status=status, start=start, end=end,
+                                           after=after, limit=limit, descending=descending)
+        metrics.inc("smartpark_db_rows_read_total", len(page), table="reservations")
+        return page, cursor
+
+    @metrics.timed("smartpark_db_seconds", op="reservation_count")
+    def reservation_count(self):
+        return self._history.count()
+
+    def _write_reservations(self, df):
+        # Rewrites replace the file so the history index can tell them from appends
+        tmp = f"{self.reservations_file}.tmp"
+        df.to_csv(tmp, index=False)
+        os.replace(tmp, self.reservations_file)
+        metrics.inc("smartpark_db_rows_written_total", len(df), table="reservations")
+
+    @metrics.timed("smartpark_db_seconds", op="add_reservation")
+    def add_reservation(self, spot_id, plate_number, name, email, phone, duration, lot=None,
+                        require_available=False):
+        """Record a reservation and mark its spot reserved.
+
+        With ``require_available`` the spot's status is checked in its shard
+        under the shard lock, and ``SpotUnavailable`` is raised unless it is
+        available, so two processes can't claim the same spot.
+        """
+        # Resolve the lot first: an unknown or misplaced spot must fail before anything is written
+        lot = self._lot_for_spot(spot_id, lot)
+        start = datetime.now()
+        end = start + timedelta(minutes=duration)
+        # Lock order everywhere: shard, then reservations
+        with self._lot_locks[lot], self._shard_lock(lot):
+            spots = self._read_shard(lot)
+            if require_available:
+                status = spots.loc[spots['spot_id'] == spot_id, 'status']
+                if status.empty or status.iloc[0] != 'available':
+                    raise SpotUnavailable(spot_id, status.iloc[0] if not status.empty else 'missing')
+
+            # The id is allocated under the same cross-process lock as the append, so
+            # processes sharing the data dir can't hand out the same one
+            with self._reservations_lock, self._reservations_file_lock():
+                previous_version = self.reservations_version()
+                new_row = pd.DataFrame([{
+                    "id": self._history.next_id(), "spot_id": spot_id, "plate_number": plate_number,
+                    "customer_name": name, "customer_email": email, "customer_phone": phone,
+                    "start_time": start.isoformat(), "end_time": end.isoformat(),
+                    "duration_minutes": duration, "status": "active", "created_at": datetime.now().isoformat()
+                }], columns=RESERVATION_COLUMNS)
+                new_row.to_csv(self.reservations_file, mode='a', header=False, index=False)
+                metrics.inc("smartpark_db_rows_written_total", 1, table="reservations")
+                reservation = new_row.iloc[0]
+
+                # An append can only move the next expiry earlier; no need for a full sweep
+                if self._expiry_state is not None and self._expiry_state[0] == previous_version:
+                    self._expiry_state = (self.reservations_version(), min(self._expiry_state[1], end))
+                    metrics.add_gauge("smartpark_active_reservations", 1)
+
+            # Update spot
+            status_changes, updated = self._apply_spot_updates(lot, spots, {spot_id: {
+                'status': 'reserved', 'plate_number': plate_number,
+                'reserved_by': name, 'reserved_until': end.isoformat(),
+            }})
+        self._publish_spot_updates(lot, status_changes, updated)
+        self.rollups.record_reservation(lot, self.layout.zone_of(spot_id), start, duration)
+        # The whole row, so followers hold the same shape as a history read
+        self.changes.emit([{"type": "reservation", **reservation.to_dict(), "id": int(reservation['id'])}])
+
+    @metrics.timed("smartpark_db_seconds", op="clear_reservations")
+    def clear_reservations(self):
+        with self._reservations_lock, self._reservations_file_lock():
+            self._write_reservations(pd.DataFrame(columns=RESERVATION_COLUMNS))
+        self.rollups.reset("reservations", "durations")
+        self.changes.emit([{"type": "reservations_cleared"}])
+
+    def _update_spots(self, lot, updates):
+        """Apply ``{spot_id: {column: value}}`` to one lot with a single shard rewrite."""
+        with self._lot_locks[lot], self._shard_lock(lot):
+            df = self._read_shard(lot)
+            status_changes, updated = self._apply_spot_updates(lot, df, updates)
+        self._publish_spot_updates(lot, status_changes, updated)
+
+    def _apply_spot_updates(self, lot, df, updates):
+        # Caller holds the shard lock and read ``df`` under it
+        now = datetime.now().isoformat()
+        status_changes = []
+        for spot_id, fields in updates.items():
+            mask = df['spot_id'] == spot_id
+            if 'status' in fields and mask.any():
+                row = df.loc[mask].iloc[0]
+                status_changes.append((row['zone'], row['status'], fields['status']))
+            for col, value in fields.items():
+                df.loc[mask, col] = value
+            df.loc[mask, 'last_updated'] = now
+        self._write_shard(lot, df)
+        return status_changes, df[df['spot_id'].isin(list(updates))]
+
+    def _publish_spot_updates(self, lot, status_changes, updated):
+        if status_changes:
+            self.rollups.record_status_changes(lot, status_changes)
+        self.changes.emit([
+            {"type": "spot", "lot": lot, "spot_id": row['spot_id'],
+             **{col: row[col] for col in SPOT_STATE_COLUMNS}}
+            for _, row in updated.iterrows()
+        ])
+
+    @metrics.timed("smartpark_db_seconds", op="update_spot_status")
+    def update_spot_status(self, spot_id, status, plate_number='', reserved_by='', reserved_until='', lot=None):
+        self._update_spots(self._lot_for_spot(spot_id, lot), {spot_id: {
+            'status': status,
+            'plate_number': plate_number,
+            'reserved_by': reserved_by,
+            'reserved_until': reserved_until,
+        }})
+
+    @metrics.timed("smartpark_db_seconds", op="clean_expired_reservations")
+    def clean_expired_reservations(self, lot=None):
+        """Expire overdue active reservations and free their spots.
+
+        A full sweep remembers the earliest remaining end_time, so calling
+        this on every rerun only stat()s the history file until either that
+        time passes or the history changes.
+        """
+        version = self.reservations_version()
+        if lot is None and self._expiry_state is not None:
+            seen_version, next_expiry = self._expiry_state
+            if seen_version == version and datetime.now() < next_expiry:
+                return
+
+        # Read and rewrite under the lock so no append lands in between and is lost
+        with self._reservations_lock, self._reservations_file_lock():
+            df = self.get_reservations_history()
+            if df.empty:
+                if lot is None:
+                    self._expiry_state = (self.reservations_version(), datetime.max)
+                    metrics.set_gauge("smartpark_active_reservations", 0)
+                return
+            active = df['status'] == 'active'
+            if lot:
+                active &= df['spot_id'].isin({s['spot_id'] for s in self.layout.spots(lot)})
+            end_times = pd.to_datetime(df.loc[active, 'end_time'])
+            overdue = end_times < datetime.now()
+            expired = end_times.index[overdue]
+            if not expired.empty:
+                df.loc[expired, 'status'] = 'expired'
+                self._write_reservations(df)
+
+            if lot is None:
+                remaining = end_times[~overdue]
+                next_expiry = remaining.min().to_pydatetime() if not remaining.empty else datetime.max
+                self._expiry_state = (self.reservations_version(), next_expiry)
+                metrics.set_gauge("smartpark_active_reservations", len(remaining))
+
+        if expired.empty:
+            return
+        # Spots are freed after the history lock is released, keeping the shard -> reservations order
+        # Rows for spots no longer in the site layout have nothing to free
+        freed = {}
+        for spot_id in df.loc[expired, 'spot_id']:
+            spot_lot = self.layout.lot_of(spot_id)
+            if spot_lot is None:
+                continue
+            freed.setdefault(spot_lot, {})[spot_id] = {
+                'status': 'available', 'plate_number': '', 'reserved_by': '', 'reserved_until': ''
+            }
+        for lot_id, updates in freed.items():
+            self._update_spots(lot_id, updates)
+        self.changes.emit([
+            {"type": "reservation", "id": int(row['id']), "spot_id": row['spot_id'],
+             "plate_number": row['plate_number'], "status": "expired"}
+            for _, row in df.loc[expired].iterrows()
+        ])
+
+    # ---- ANPR detections ----
+    def emergency_plates(self):
+        df = pd.read_csv(self.emergency_vehicles_file, dtype=str, keep_default_na=False)
+        return set(df.loc[df['is_active'].str.lower() == 'true', 'plate_number'].str.upper())
+
+    def _migrate_legacy_detections(self, batch=100_000):
+        # Ids are reassigned by the log; the old file is kept aside rather than deleted
+        with open(self.anpr_detections_file, newline='') as file:
+            rows = []
+            for row in csv.DictReader(file):
+                rows.append(row)
+                if len(rows) >= batch:
+                    self.detections.append(rows)
+                    rows = []
+            self.detections.append(rows)
+        self.detections.rotate()
+        os.replace(self.anpr_detections_file, f"{self.anpr_detections_file}.migrated")
+
+    @metrics.timed("smartpark_db_seconds", op="add_detections")
+    def add_detections(self, detections):
+        """Append a batch of ``{plate_number, confidence, camera_location[, detection_time]}`` dicts.
+
+        The batch is one append, one rollup update and one change-feed emit
+        regardless of its size. Returns the stored rows.
+        """
+        if not detections:
+            return []
+        emergency = self.emergency_plates()
+        # Validate the whole batch before anything is written
+        rows, times = [], []
+        for detection in detections:
+            plate = str(detection['plate_number']).replace(' ', '').upper()
+            when = detection.get('detection_time')
+            when = datetime.fromisoformat(str(when)) if when else datetime.now()
+            times.append(when)
+            rows.append({
+                'plate_number': plate,
+                'confidence': round(float(detection.get('confidence', 0)), 3),
+                'detection_time': when.strftime("%Y-%m-%d %H:%M:%S"),
+                'camera_location': detection.get('camera_location', 'Camera_1'),
+                'is_emergency': plate in emergency, 'processed': False,
+            })
+        rows = self.detections.append(rows)
+        metrics.inc("smartpark_db_rows_written_total", len(rows), table="detections")
+
+        self.rollups.record_detections([
+            (row['camera_location'], when, row['is_emergency']) for row, when in zip(rows, times)
+        ])
+        self.changes.emit([{"type": "detection", **row} for row in rows])
+        return rows
+
+    @metrics.timed("smartpark_db_seconds", op="plate_sightings")
+    def plate_sightings(self, plate, start=None, end=None, camera=None, limit=100):
+        """Detections of ``plate``, newest first, read through the detection log's index."""
+        return self.detections.query(start=start, end=end, camera=camera, plate=plate,
+                                     limit=limit, newest_first=True)
+
+    # ---- Rollups ----
+    @metrics.timed("smartpark_db_seconds", op="rebuild_rollups")
+    def rebuild_rollups(self, chunksize=500_000):
+        """Recompute the aggregate tables from raw data (first start or after manual edits).
+
+        Hourly occupancy can't be reconstructed from history and starts
+        accumulating from here on.
+        """
+        self.rollups.reset("reservations", "detections", "durations")
+        for lot in self.layout.lot_ids:
+            counts = self._read_shard(lot).groupby(['zone', 'status']).size().to_dict()
+            self.rollups.set_status_counts(lot, counts)
+
+        spot_lot = {}
+        spot_zone = {}
+        for lot in self.layout.lot_ids:
+            for spot in self.layout.spots(lot):
+                spot_lot[spot['spot_id']] = lot
+                spot_zone[spot['spot_id']] = spot['zone']
+
+        hourly = {}
+        durations = {}
+        if os.path.exists(self.reservations_file):
+            for chunk in pd.read_csv(self.reservations_file, chunksize=chunksize,
+                                     usecols=['spot_id', 'start_time', 'duration_minutes']):
+                chunk = chunk.dropna()
+                chunk['hour'] = pd.to_datetime(chunk['start_time']).dt.strftime("%Y-%m-%d %H:00")
+                chunk['lot'] = chunk['spot_id'].map(spot_lot)
+                chunk['zone'] = chunk['spot_id'].map(spot_zone)
+                chunk = chunk.dropna(subset=['lot'])
+                grouped = chunk.groupby(['hour', 'lot', 'zone'])['duration_minutes'].agg(['size', 'sum'])
+                for key, row in grouped.iterrows():
+                    totals = hourly.setdefault(key, {'reservations': 0, 'reserved_minutes': 0})
+                    totals['reservations'] += int(row['size'])
+                    totals['reserved_minutes'] += int(row['sum'])
+                buckets = chunk['duration_minutes'].astype(int).map(duration_bucket)
+                for key, n in chunk.assign(bucket=buckets).groupby(['lot', 'bucket']).size().items():
+                    durations[key] = durations.get(key, 0) + int(n)
+        self.rollups.load_hourly("reservations", hourly)
+        self.rollups.load_durations(durations)
+
+        detections = {}
+        for path, compressed in self.detections.segment_files():
+            for chunk in pd.read_csv(path, header=None, names=DETECTION_COLUMNS, chunksize=chunksize,
+                                     compression='gzip' if compressed else None,
+                                     usecols=['detection_time', 'camera_location', 'is_emergency']):
+                chunk['hour'] = pd.to_datetime(chunk['detection_time']).dt.strftime("%Y-%m-%d %H:00")
+                chunk['emergency'] = chunk['is_emergency'].astype(str).str.lower().eq('true').astype(int)
+                grouped = chunk.groupby(['hour', 'camera_location'])['emergency'].agg(['size', 'sum'])
+                for key, row in grouped.iterrows():
+                    totals = detections.setdefault(key, {'detections': 0, 'emergency': 0})
+                    totals['detections'] += int(row['size'])
+                    totals['emergency'] += int(row['sum'])
+        self.rollups.load_hourly("detections", detections)
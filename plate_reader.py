@@ -1,35 +1,80 @@
-import cv2
-import easyocr
+import argparse
 import time
-import csv
 import os
-from ultralytics import YOLO
+import threading
+from datetime import datetime
+
+# cv2, easyocr and ultralytics are imported where they're first needed: they
+# take seconds to load, and the CLI, the supervisor's probes and tooling that
+# only touches the detection files shouldn't pay for them.
+import metrics
+from changefeed import ChangeFeed
+from detection_log import DetectionLog
+from fileutil import default_data_dir
+from live_view import LiveView, annotate
+from rollups import RollupEngine
 
 
 class ANPRDetector:
-    def __init__(self):
-        # Initialize YOLO models
-        self.car_model = YOLO('yolov8n.pt')  # For car detection
-        self.plate_model = YOLO('yolov8n.pt')  # You may want to use a license plate specific model
+    CAR_WEIGHTS = 'yolov8n.pt'  # For car detection
+    PLATE_WEIGHTS = 'yolov8n.pt'  # You may want to use a license plate specific model
 
-        # Initialize EasyOCR
-        self.reader = easyocr.Reader([])
+    def __init__(self, data_dir=None):
+        self.data_dir = data_dir or default_data_dir()
+        # Models load on first use (or in warm_up); see the properties below
+        self._car_model = None
+        self._plate_model = None
+        self._reader = None
+        self._models_lock = threading.Lock()
 
         # Create directory if it doesn't exist
-        os.makedirs('parking_data', exist_ok=True)
-
-        # CSV file path
-        self.csv_file = 'parking_data/anpr_detections.csv'
-
-        # Initialize CSV file with headers if it doesn't exist
-        if not os.path.exists(self.csv_file):
-            with open(self.csv_file, 'w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(['id', 'plate_number', 'confidence', 'detection_time',
-                                 'camera_location', 'is_emergency', 'processed'])
-
-        self.detection_id = 1
-
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        # Shared with the web app and the other detectors; ids continue across restarts
+        self.detections = DetectionLog.open(self.data_dir)
+
+        # Hourly per-camera detection counts for the analytics pages
+        self.rollups = RollupEngine(os.path.join(self.data_dir, 'rollups'))
+        self.changes = ChangeFeed(os.path.join(self.data_dir, 'changes.log'))
+
+    # ---- Models ----
+    @property
+    def car_model(self):
+        with self._models_lock:
+            if self._car_model is None:
+                from ultralytics import YOLO
+                self._car_model = YOLO(self.CAR_WEIGHTS)
+            return self._car_model
+
+    @property
+    def plate_model(self):
+        car_model = self.car_model
+        with self._models_lock:
+            if self._plate_model is None:
+                if self.PLATE_WEIGHTS == self.CAR_WEIGHTS:
+                    # Same weights: one loaded model serves both stages
+                    self._plate_model = car_model
+                else:
+                    from ultralytics import YOLO
+                    self._plate_model = YOLO(self.PLATE_WEIGHTS)
+            return self._plate_model
+
+    @property
+    def reader(self):
+        with self._models_lock:
+            if self._reader is None:
+                import easyocr
+                self._reader = easyocr.Reader([])
+            return self._reader
+
+    def warm_up(self):
+        """Load every model now instead of on the first frame that needs it."""
+        with metrics.timer("smartpark_anpr_warm_up_seconds"):
+            self.car_model
+            self.plate_model
+            self.reader
+
+    @metrics.timed("smartpark_anpr_stage_seconds", stage="detect_cars")
     def detect_cars(self, frame):
         """Detect cars in the frame"""
         results = self.car_model(frame)
@@ -46,6 +91,7 @@ class ANPRDetector:
 
         return car_boxes
 
+    @metrics.timed("smartpark_anpr_stage_seconds", stage="detect_plates")
     def detect_plates_in_car(self, frame, car_box):
         """Detect license plates within car region"""
         x1, y1, x2, y2 = car_box
@@ -65,6 +111,7 @@ class ANPRDetector:
 
         return plate_boxes
 
+    @metrics.timed("smartpark_anpr_stage_seconds", stage="ocr")
     def read_plate_text(self, frame, plate_box):
         """Extract text from license plate using EasyOCR"""
         x1, y1, x2, y2 = plate_box
@@ -82,28 +129,39 @@ class ANPRDetector:
 
         return None, 0
 
+    @metrics.timed("smartpark_anpr_stage_seconds", stage="save_detection")
     def save_detection(self, plate_text, confidence, camera_location="Camera_1"):
-        """Save detection to CSV file"""
-        detection_time = time.strftime("%Y-%m-%d %H:%M:%S")
-
-        with open(self.csv_file, 'a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([
-                self.detection_id,
-                plate_text,
-                round(confidence, 3),
-                detection_time,
-                camera_location,
-                False,  # is_emergency
-                False  # processed
-            ])
-
-        self.detection_id += 1
+        """Append detection to the detection log"""
+        now = datetime.now()
+        detection_time = now.strftime("%Y-%m-%d %H:%M:%S")
+
+        row, = self.detections.append([{
+            "plate_number": plate_text,
+            "confidence": round(confidence, 3),
+            "detection_time": detection_time,
+            "camera_location": camera_location,
+            "is_emergency": False,
+            "processed": False,
+        }])
+
+        self.rollups.record_detections([(camera_location, now, False)])
+        self.changes.emit([{
+            "type": "detection", "id": row["id"], "plate_number": plate_text,
+            "confidence": round(confidence, 3), "camera_location": camera_location,
+            "detection_time": detection_time
+        }])
+        metrics.inc("smartpark_anpr_detections_total", camera=camera_location)
 
     def process_frame(self, frame, camera_location="Camera_1"):
         """Process a single frame for ANPR"""
+        with metrics.timer("smartpark_anpr_frame_seconds", camera=camera_location):
+            return self._process_frame(frame, camera_location)
+
+    def _process_frame(self, frame, camera_location):
+        metrics.inc("smartpark_anpr_frames_total", camera=camera_location)
         # Detect cars
         car_boxes = self.detect_cars(frame)
+        metrics.inc("smartpark_anpr_cars_total", len(car_boxes), camera=camera_location)
 
         detections = []
 
@@ -119,12 +177,7 @@ class ANPRDetector:
                     # Save detection
                     self.save_detection(plate_text, confidence, camera_location)
 
-                    # Draw bounding boxes on frame
-                    cv2.rectangle(frame, (car_box[0], car_box[1]), (car_box[2], car_box[3]), (0, 255, 0), 2)
-                    cv2.rectangle(frame, (plate_box[0], plate_box[1]), (plate_box[2], plate_box[3]), (0, 0, 255), 2)
-                    cv2.putText(frame, f"{plate_text} ({confidence:.2f})",
-                                (plate_box[0], plate_box[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-
+                    # Boxes are drawn only by consumers that show the frame (see live_view.annotate)
                     detections.append({
                         'plate_text': plate_text,
                         'confidence': confidence,
@@ -134,34 +187,59 @@ class ANPRDetector:
 
         return frame, detections
 
-    def run_camera(self, camera_index=0):
-        """Run ANPR on camera feed"""
+    def run_camera(self, camera_index=0, camera_location="Camera_1", display=True, heartbeat=None, live=None):
+        """Run ANPR on camera feed
+
+        ``heartbeat`` is a file touched after every frame so a supervisor can
+        tell a stalled capture loop from a busy one. ``live`` is an optional
+        started ``LiveView`` that frames are offered to.
+        """
+        import cv2
+
+        # Load the models while the capture device opens instead of after it
+        loader = threading.Thread(target=self.warm_up, name="anpr-warm-up", daemon=True)
+        loader.start()
         cap = cv2.VideoCapture(camera_index)
+        loader.join()
 
+        last_rotation_check = time.monotonic()
         while True:
             ret, frame = cap.read()
             if not ret:
                 break
 
             # Process frame
-            processed_frame, detections = self.process_frame(frame)
+            processed_frame, detections = self.process_frame(frame, camera_location)
+            if heartbeat:
+                touch(heartbeat)
+            if live is not None:
+                live.publish(processed_frame, detections)
+            # Age-based rotation also has to happen when no plates are being seen
+            if time.monotonic() - last_rotation_check > 60:
+                self.detections.maybe_rotate()
+                last_rotation_check = time.monotonic()
 
             # Display frame
-            cv2.imshow('ANPR Detection', processed_frame)
+            if display:
+                # Draw on a copy: the live view's encoder may still be reading this frame
+                cv2.imshow('ANPR Detection', annotate(processed_frame.copy(), detections))
 
             # Print detections
             for detection in detections:
                 print(f"Detected: {detection['plate_text']} (Confidence: {detection['confidence']:.3f})")
 
             # Exit on 'q' key
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            if display and cv2.waitKey(1) & 0xFF == ord('q'):
                 break
 
         cap.release()
-        cv2.destroyAllWindows()
+        if display:
+            cv2.destroyAllWindows()
 
     def process_image(self, image_path):
         """Process a single image"""
+        import cv2
+
         frame = cv2.imread(image_path)
         if frame is None:
             print(f"Could not load image: {image_path}")
@@ -170,22 +248,50 @@ class ANPRDetector:
         processed_frame, detections = self.process_frame(frame)
 
         # Save processed image
-        output_path = f"parking_data/processed_{os.path.basename(image_path)}"
-        cv2.imwrite(output_path, processed_frame)
+        output_path = os.path.join(self.data_dir, f"processed_{os.path.basename(image_path)}")
+        cv2.imwrite(output_path, annotate(processed_frame, detections))
 
         print(f"Processed image saved to: {output_path}")
         for detection in detections:
             print(f"Detected: {detection['plate_text']} (Confidence: {detection['confidence']:.3f})")
 
 
-# Example usage
-if __name__ == "__main__":
-    detector = ANPRDetector()
+def touch(path):
+    with open(path, 'a'):
+        os.utime(path)
 
-    # for camera
-    detector.run_camera(0)
 
-    # path to an image
-    # detector.process_image('path_to_your_image.jpg')
+def camera_source(value):
+    """Device index for digits, otherwise a stream URL or video file path."""
+    return int(value) if value.isdigit() else value
 
-    print("ANPR Detector initialized. Use run_camera() or process_image() methods.")
\ No newline at end of file
+
+# Example usage
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ANPR detector")
+    parser.add_argument("--source", type=camera_source, default=0, help="camera index, stream URL or video file")
+    parser.add_argument("--camera-name", default="Camera_1", help="camera_location recorded with detections")
+    parser.add_argument("--image", help="process a single image instead of a camera feed")
+    parser.add_argument("--headless", action="store_true", help="don't open a preview window")
+    parser.add_argument("--heartbeat", help="file touched after every processed frame")
+    parser.add_argument("--live-port", type=int, help="serve an annotated MJPEG stream on this port")
+    parser.add_argument("--live-fps", type=float, default=5, help="frame rate cap for the live stream")
+    parser.add_argument("--live-host", default="127.0.0.1",
+                        help="interface the live stream binds to (it has no authentication)")
+    parser.add_argument("--data-dir", default=default_data_dir(), help="shared SmartPark data directory")
+    args = parser.parse_args()
+
+    metrics.start_exporter(f"anpr-{args.camera_name}", metrics_dir=os.path.join(args.data_dir, "metrics"))
+    detector = ANPRDetector(args.data_dir)
+    if args.image:
+        detector.process_image(args.image)
+    else:
+        live = (LiveView(args.camera_name, args.live_port, host=args.live_host, max_fps=args.live_fps,
+                         live_dir=os.path.join(args.data_dir, "run", "live")).start()
+                if args.live_port else None)
+        try:
+            detector.run_camera(args.source, args.camera_name, display=not args.headless,
+                                heartbeat=args.heartbeat, live=live)
+        finally:
+            if live is not None:
+                live.stop()
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""Startup profile for the web app and the ANPR detector.
+
+Each target runs in a fresh interpreter under ``-X importtime`` and walks
+through its startup phases in order, timing each one. The report lists the
+phases (wall time, cumulative) followed by the slowest top-level imports
+from the ``-X importtime`` trace.
+
+    python profile_startup.py                    # both targets
+    python profile_startup.py web --top 20
+    python profile_startup.py detector --image samples/gate.jpg --json startup.json
+
+Web phases end with the first rendered page (via Streamlit's ``AppTest``, when
+available) and then the on-demand import of the admin pages. Detector
+phases end with the first and second processed frame, so model loading
+and steady-state inference are reported separately.
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from fileutil import DATA_DIR_ENV, default_data_dir
+
+TARGETS = ("web", "detector")
+RESULT_PREFIX = "PROFILE_RESULT "
+START_MARKER = "PROFILE_START"
+
+
+# ==== Phases (run in the child interpreter) ====
+class Phases:
+    def __init__(self):
+        self.results = []
+        self.origin = time.perf_counter()
+
+    def run(self, name, fn):
+        start = time.perf_counter()
+        try:
+            value = fn()
+            error = None
+        except Exception as exc:  # report and keep going; later phases may still be informative
+            value, error = None, f"{type(exc).__name__}: {exc}"
+        end = time.perf_counter()
+        self.results.append({"phase": name, "ms": (end - start) * 1000,
+                             "at_ms": (end - self.origin) * 1000, "error": error})
+        return value
+
+
+def web_phases(phases, args):
+    phases.run("import streamlit", lambda: importlib.import_module("streamlit"))
+    phases.run("import pandas", lambda: importlib.import_module("pandas"))
+    parking_db = phases.run("import parking_db", lambda: importlib.import_module("parking_db"))
+    if parking_db is not None:
+        phases.run("ParkingDatabase() init", lambda: parking_db.ParkingDatabase(args.data_dir))
+
+    def first_page():
+        from streamlit.testing.v1 import AppTest
+        app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "entrypoint.py"),
+                                default_timeout=120)
+        app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+    phases.run("first page render", first_page)
+    phases.run("import admin (first admin page)", lambda: importlib.import_module("admin"))
+
+
+def detector_phases(phases, args):
+    plate_reader = phases.run("import plate_reader", lambda: importlib.import_module("plate_reader"))
+    detector = phases.run("ANPRDetector() init", lambda: plate_reader.ANPRDetector(args.data_dir))
+    if detector is None:
+        return
+    phases.run("import ultralytics", lambda: importlib.import_module("ultralytics"))
+    phases.run("load YOLO models", lambda: (detector.car_model, detector.plate_model))
+    phases.run("import easyocr", lambda: importlib.import_module("easyocr"))
+    phases.run("load EasyOCR reader", lambda: detector.reader)
+    cv2 = phases.run("import cv2", lambda: importlib.import_module("cv2"))
+
+    def load_frame():
+        if args.image:
+            return cv2.imread(args.image)
+        import numpy as np
+        return np.zeros((480, 640, 3), dtype=np.uint8)
+    frame = phases.run("read frame", load_frame) if cv2 is not None else None
+    if frame is not None:
+        phases.run("first frame", lambda: detector.process_frame(frame.copy(), "Profile"))
+        phases.run("second frame", lambda: detector.process_frame(frame.copy(), "Profile"))
+
+
+def run_child(args):
+    # Imports traced before this line belong to the profiler itself
+    print(START_MARKER, file=sys.stderr, flush=True)
+    phases = Phases()
+    (web_phases if args.target == "web" else detector_phases)(phases, args)
+    print(RESULT_PREFIX + json.dumps(phases.results), flush=True)
+
+
+# ==== Import trace ====
+def parse_importtime(stderr):
+    """``-X importtime`` lines as ``(module, self_us, cumulative_us, depth)``."""
+    entries = []
+    if START_MARKER in stderr:
+        stderr = stderr.split(START_MARKER, 1)[1]
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return entries
+
+
+def top_imports(entries, top):
+    """Slowest imports that weren't pulled in by another import (depth 0)."""
+    roots = [e for e in entries if e[3] == 0]
+    totals = {}
+    for name, _, cumulative, _ in roots:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + cumulative
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return [{"package": p, "ms": us / 1000} for p, us in ranked[:top]], sum(totals.values()) / 1000
+
+
+# ==== Driver ====
+def profile(target, args):
+    # The child runs from the repo; everything that falls back to default_data_dir()
+    # (the app page, the detector, metrics) must see the same directory
+    data_dir = os.path.abspath(args.data_dir)
+    command = [sys.executable, "-X", "importtime", os.path.abspath(__file__), target, "--child",
+               "--data-dir", data_dir]
+    if args.image:
+        command += ["--image", os.path.abspath(args.image)]
+    start = time.perf_counter()
+    proc = subprocess.run(command, capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)),
+                          env={**os.environ, DATA_DIR_ENV: data_dir})
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    phases = []
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            phases = json.loads(line[len(RESULT_PREFIX):])
+    imports, import_ms = top_imports(parse_importtime(proc.stderr), args.top)
+    if not phases:
+        tail = "\n".join(l for l in proc.stderr.splitlines()
+                         if not l.startswith("import time:") and l != START_MARKER)[-2000:]
+        print(f"{target}: profiling run failed (exit {proc.returncode})\n{tail}")
+    return {"target": target, "wall_ms": wall_ms, "import_ms": import_ms,
+            "phases": phases, "top_imports": imports}
+
+
+def print_report(report):
+    print(f"== {report['target']}: {report['wall_ms']:.0f} ms process wall time, "
+          f"{report['import_ms']:.0f} ms in imports")
+    for phase in report["phases"]:
+        status = f"  ! {phase['error']}" if phase["error"] else ""
+        print(f"  {phase['phase']:<34} {phase['ms']:>9.1f} ms   (t+{phase['at_ms']:>8.1f} ms){status}")
+    print("  slowest top-level imports:")
+    for entry in report["top_imports"]:
+        print(f"    {entry['package']:<32} {entry['ms']:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", nargs="*", help=f"any of {', '.join(TARGETS)} (default: all)")
+    parser.add_argument("--top", type=int, default=15, help="number of imports to list")
+    parser.add_argument("--data-dir", default=default_data_dir())
+    parser.add_argument("--image", help="frame for the detector phases (default: a blank 640x480 frame)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.targets = args.targets or list(TARGETS)
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(sorted(unknown))}")
+
+    if args.child:
+        args.target = args.targets[0]
+        run_child(args)
+        return
+
+    reports = [profile(target, args) for target in args.targets]
+    for report in reports:
+        print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(reports, file, indent=2)
+        print(f"Results written to {os.path.abspath(args.json)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Incrementally maintained analytics aggregates.
+
+Writers (``ParkingDatabase`` and the ANPR detector) report each event as it
+happens and the engine folds it into small CSV tables under ``rollups/``:
+
+- ``zone_status.csv``            current spot count per lot/zone/status
+- ``duration_histogram.csv``     reservations per lot and duration bucket
+- ``occupancy/<day>.csv``        per hour, lot and zone: peak spots in use, status changes
+- ``reservations/<day>.csv``     per hour, lot and zone: reservations, reserved minutes
+- ``detections/<day>.csv``       per hour and camera: detections, emergency detections
+
+Hourly tables are partitioned by day, so recording an event rewrites at most
+a few dozen rows. Analytics pages read these tables instead of scanning raw
+history. Only the standard library is used so the detector can record
+detections without pulling in pandas.
+"""
+import csv
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from fileutil import FileLock, file_version
+
+IN_USE_STATUSES = ("reserved", "occupied")
+DURATION_BUCKETS = [15, 30, 60, 120, 180, 240, 480]
+
+
+def duration_bucket(minutes):
+    for edge in DURATION_BUCKETS:
+        if minutes <= edge:
+            return f"<= {edge}"
+    return f"> {DURATION_BUCKETS[-1]}"
+
+
+def hour_key(when):
+    return when.strftime("%Y-%m-%d %H:00")
+
+
+class _Table:
+    """Small keyed counter table persisted as one CSV.
+
+    Values are summed on ``add`` except for columns listed in ``maxed``,
+    which keep the largest value seen.
+    """
+
+    def __init__(self, path, keys, values, maxed=()):
+        self.path = path
+        self.keys = keys
+        self.values = values
+        self.maxed = set(maxed)
+        self.rows = {}
+        self._version = False  # never loaded
+
+    def load_if_changed(self):
+        version = file_version(self.path)
+        if version == self._version:
+            return
+        self.rows = {}
+        if version is not None:
+            with open(self.path, newline="") as file:
+                for record in csv.DictReader(file):
+                    key = tuple(record[k] for k in self.keys)
+                    self.rows[key] = [int(record[v]) for v in self.values]
+        self._version = version
+
+    def add(self, key, **amounts):
+        row = self.rows.setdefault(key, [0] * len(self.values))
+        for name, amount in amounts.items():
+            i = self.values.index(name)
+            row[i] = max(row[i], amount) if name in self.maxed else row[i] + amount
+
+    def set(self, key, **amounts):
+        row = self.rows.setdefault(key, [0] * len(self.values))
+        for name, amount in amounts.items():
+            row[self.values.index(name)] = amount
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.keys + self.values)
+            for key in sorted(self.rows):
+                writer.writerow(list(key) + self.rows[key])
+        os.replace(tmp, self.path)
+        self._version = file_version(self.path)
+
+    def records(self):
+        self.load_if_changed()
+        return [dict(zip(self.keys + self.values, list(key) + row))
+                for key, row in sorted(self.rows.items())]
+
+
+class RollupEngine:
+    TABLES = {
+        "occupancy": (["hour", "lot", "zone"], ["peak_in_use", "status_changes"], ["peak_in_use"]),
+        "reservations": (["hour", "lot", "zone"], ["reservations", "reserved_minutes"], []),
+        "detections": (["hour", "camera_location"], ["detections", "emergency"], []),
+    }
+
+    def __init__(self, rollup_dir):
+        self.rollup_dir = rollup_dir
+        os.makedirs(rollup_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.zone_status = _Table(os.path.join(rollup_dir, "zone_status.csv"),
+                                  ["lot", "zone", "status"], ["spots"])
+        self.durations = _Table(os.path.join(rollup_dir, "duration_histogram.csv"),
+                                ["lot", "bucket"], ["reservations"])
+        self._daily = {}  # (table, day) -> _Table
+
+    def _day_table(self, name, day):
+        key = (name, day)
+        if key not in self._daily:
+            if len(self._daily) > 64:
+                self._daily.clear()
+            keys, values, maxed = self.TABLES[name]
+            self._daily[key] = _Table(os.path.join(self.rollup_dir, name, f"{day}.csv"),
+                                      keys, values, maxed)
+        return self._daily[key]
+
+    @contextmanager
+    def _write(self):
+        """Lock for a load-modify-save cycle shared with other processes."""
+        with self._lock, FileLock(os.path.join(self.rollup_dir, ".lock")):
+            yield
+
+    def exists(self):
+        return os.path.exists(self.zone_status.path)
+
+    # ---- Recording ----
+    def record_status_changes(self, lot, changes, when=None):
+        """``changes`` is a list of ``(zone, old_status, new_status)``."""
+        when = when or datetime.now()
+        with self._write():
+            self.zone_status.load_if_changed()
+            occupancy = self._day_table("occupancy", when.strftime("%Y-%m-%d"))
+            occupancy.load_if_changed()
+            touched = set()
+            for zone, old, new in changes:
+                if old == new:
+                    continue
+                self.zone_status.add((lot, zone, old), spots=-1)
+                self.zone_status.add((lot, zone, new), spots=1)
+                occupancy.add((hour_key(when), lot, zone), status_changes=1)
+                touched.add(zone)
+            if not touched:
+                return
+            for zone in touched:
+                in_use = sum(self.zone_status.rows.get((lot, zone, s), [0])[0] for s in IN_USE_STATUSES)
+                occupancy.add((hour_key(when), lot, zone), peak_in_use=in_use)
+            self.zone_status.save()
+            occupancy.save()
+
+    def set_status_counts(self, lot, counts):
+        """Replace one lot's current counts with ``{(zone, status): spots}``."""
+        with self._write():
+            self.zone_status.load_if_changed()
+            self.zone_status.rows = {k: v for k, v in self.zone_status.rows.items() if k[0] != lot}
+            for (zone, status), spots in counts.items():
+                self.zone_status.set((lot, zone, status), spots=int(spots))
+            self.zone_status.save()
+
+    def record_reservation(self, lot, zone, start, duration_minutes):
+        with self._write():
+            table = self._day_table("reservations", start.strftime("%Y-%m-%d"))
+            table.load_if_changed()
+            table.add((hour_key(start), lot, zone), reservations=1, reserved_minutes=int(duration_minutes))
+            table.save()
+            self.durations.load_if_changed()
+            self.durations.add((lot, duration_bucket(duration_minutes)), reservations=1)
+            self.durations.save()
+
+    def record_detections(self, detections):
+        """``detections`` is a list of ``(camera_location, detection_time, is_emergency)``."""
+        by_day = {}
+        for camera, when, emergency in detections:
+            by_day.setdefault(when.strftime("%Y-%m-%d"), []).append((camera, when, emergency))
+        with self._write():
+            for day, rows in by_day.items():
+                table = self._day_table("detections", day)
+                table.load_if_changed()
+                for camera, when, emergency in rows:
+                    table.add((hour_key(when), camera), detections=1, emergency=int(bool(emergency)))
+                table.save()
+
+    def reset(self, *names):
+        """Drop the given tables ("zone_status", "durations" or an hourly table name)."""
+        with self._write():
+            for name in names:
+                if name in self.TABLES:
+                    folder = os.path.join(self.rollup_dir, name)
+                    if os.path.isdir(folder):
+                        for filename in os.listdir(folder):
+                            os.remove(os.path.join(folder, filename))
+                    self._daily = {k: t for k, t in self._daily.items() if k[0] != name}
+                else:
+                    table = getattr(self, name)
+                    table.rows = {}
+                    table.save()
+
+    def load_hourly(self, name, rows):
+        """Bulk-replace an hourly table from precomputed ``{key tuple: {value: n}}`` (used for rebuilds)."""
+        by_day = {}
+        for key, values in rows.items():
+            by_day.setdefault(key[0][:10], {})[key] = values
+        with self._write():
+            for day, day_rows in by_day.items():
+                table = self._day_table(name, day)
+                table.rows = {}
+                for key, values in day_rows.items():
+                    table.set(key, **values)
+                table.save()
+
+    def load_durations(self, counts):
+        with self._write():
+            self.durations.rows = {}
+            for key, n in counts.items():
+                self.durations.set(key, reservations=int(n))
+            self.durations.save()
+
+    # ---- Reading ----
+    def status_counts(self, lot=None):
+        return [r for r in self.zone_status.records() if lot is None or r["lot"] == lot]
+
+    def duration_histogram(self, lot=None):
+        return [r for r in self.durations.records() if lot is None or r["lot"] == lot]
+
+    def hourly(self, name, since, until=None, lot=None):
+        """Rows of an hourly table from ``since`` to ``until`` (default now), oldest first."""
+        until = until or datetime.now()
+        records = []
+        day = since.date()
+        while day <= until.date():
+            records += self._day_table(name, day.isoformat()).records()
+            day += timedelta(days=1)
+        start, end = hour_key(since), hour_key(until)
+        return [r for r in records
+                if start <= r["hour"] <= end and (lot is None or r.get("lot", lot) == lot)]
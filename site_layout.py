@@ -0,0 +1,120 @@
+"""Declarative site layout: lots -> levels -> zones -> spots.
+
+The layout is a JSON document (see ``site_layout.json``)::
+
+    {"lots": [{"id": "main", "name": "Main Lot", "levels": [
+        {"id": "G", "name": "Ground", "zones": [
+            {"id": "A", "name": "VIP", "spots": 10, "origin": [1, 4]}]}]}]}
+
+Zone options: ``spots`` (count), ``origin`` ([x, y] of the first spot on the
+map grid, default the row below the level's previous zone with one row
+between them), ``per_row`` (spots per map row, default all on one row) and
+``prefix`` (spot id prefix, default the zone id). Spot ids are
+``<prefix><number>`` zero-padded to at least two digits and must be unique
+across the whole site.
+"""
+import json
+import os
+
+LAYOUT_FILENAME = "site_layout.json"
+DEFAULT_LAYOUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), LAYOUT_FILENAME)
+
+# Used when no layout file exists: the original single lot of 4 zones x 10 spots
+DEFAULT_LAYOUT = {
+    "lots": [{
+        "id": "main", "name": "Main Lot",
+        "levels": [{
+            "id": "G", "name": "Ground",
+            "zones": [
+                {"id": "A", "name": "VIP", "spots": 10, "origin": [1, 4]},
+                {"id": "B", "name": "Regular", "spots": 10, "origin": [1, 3]},
+                {"id": "S", "name": "Staff", "spots": 10, "origin": [1, 2]},
+                {"id": "E", "name": "Emergency", "spots": 10, "origin": [1, 1]},
+            ]
+        }]
+    }]
+}
+
+
+class SiteLayout:
+    def __init__(self, config):
+        self.config = config
+        self.lots = {}          # lot id -> lot config
+        self.zone_names = {}    # zone id -> display name
+        self._spots = {}        # lot id -> [spot dict]
+        self._spot_lot = {}     # spot id -> lot id
+        self._spot_zone = {}    # spot id -> zone id
+
+        for lot in config.get("lots", []):
+            lot_id = str(lot["id"])
+            if lot_id in self.lots:
+                raise ValueError(f"Duplicate lot id in site layout: {lot_id}")
+            self.lots[lot_id] = lot
+            self._spots[lot_id] = self._expand_lot(lot_id, lot)
+
+        if not self.lots:
+            raise ValueError("Site layout defines no lots")
+
+    def _expand_lot(self, lot_id, lot):
+        spots = []
+        for level in lot.get("levels", []):
+            level_id = str(level["id"])
+            next_y = 1  # zones without an origin stack below the previous zone
+            for zone in level.get("zones", []):
+                zone_id = str(zone["id"])
+                self.zone_names.setdefault(zone_id, zone.get("name", ""))
+                count = int(zone["spots"])
+                prefix = zone.get("prefix", zone_id)
+                origin_x, origin_y = zone.get("origin", [1, next_y])
+                per_row = int(zone.get("per_row") or count or 1)
+                next_y = max(next_y, origin_y + -(-count // per_row) + 1)
+                width = max(2, len(str(count)))
+                for i in range(count):
+                    spot_id = f"{prefix}{i + 1:0{width}}"
+                    if spot_id in self._spot_lot:
+                        raise ValueError(f"Duplicate spot id in site layout: {spot_id}")
+                    self._spot_lot[spot_id] = lot_id
+                    self._spot_zone[spot_id] = zone_id
+                    spots.append({
+                        "spot_id": spot_id, "lot": lot_id, "level": level_id, "zone": zone_id,
+                        "x": origin_x + i % per_row, "y": origin_y + i // per_row,
+                    })
+        return spots
+
+    @property
+    def lot_ids(self):
+        return list(self.lots)
+
+    def lot_name(self, lot_id):
+        return self.lots[lot_id].get("name", lot_id)
+
+    def spots(self, lot_id):
+        """Static spot definitions (id, lot, level, zone, x, y) for one lot."""
+        return [dict(spot) for spot in self._spots[lot_id]]
+
+    def lot_of(self, spot_id):
+        """Lot id a spot belongs to, or None if the layout doesn't define it."""
+        return self._spot_lot.get(spot_id)
+
+    def zone_of(self, spot_id):
+        return self._spot_zone.get(spot_id)
+
+    def spot_count(self, lot_id=None):
+        if lot_id is not None:
+            return len(self._spots[lot_id])
+        return len(self._spot_lot)
+
+
+def load_site_layout(path=None, data_dir=None):
+    """Load the layout from ``path``, else ``<data_dir>/site_layout.json``,
+    else the repo-level ``site_layout.json``, else ``DEFAULT_LAYOUT``."""
+    candidates = [path]
+    if data_dir:
+        candidates.append(os.path.join(data_dir, LAYOUT_FILENAME))
+    candidates.append(DEFAULT_LAYOUT_FILE)
+
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            with open(candidate) as file:
+                return SiteLayout(json.load(file))
+    return SiteLayout(DEFAULT_LAYOUT)
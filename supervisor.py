@@ -0,0 +1,375 @@
+"""Process supervisor for the SmartPark stack.
+
+Starts the Streamlit app, the HTTP API and one ANPR worker per configured
+camera in parallel, each in its own process group, and keeps them running:
+
+- a one-shot ``init`` step prepares the data directory first, so the other
+  processes never race to create or migrate the same files;
+- a service starts only once everything it ``requires`` is ready, and is
+  ready once its probe passes (an HTTP 200, a fresh heartbeat file, or
+  simply staying up for a moment when it has no probe);
+- running services are re-probed and killed after ``unhealthy_after``
+  consecutive failures;
+- exited services are restarted with exponential backoff, which resets
+  once a process has stayed up for ``stable_after`` seconds;
+- each process can be pinned to a CPU set (``"cpus": [2, 3]``), and with
+  ``"cpus": "auto"`` ANPR workers get a dedicated core each while the
+  other services share the rest;
+- SIGINT/SIGTERM stop services in reverse start order, escalating to
+  SIGKILL after ``stop_timeout`` seconds.
+
+The configuration is JSON (see ``supervisor.json``); anything it leaves
+out falls back to ``DEFAULT_CONFIG``. Service states are written to
+``<data_dir>/run/services.json`` for the admin pages and other tooling.
+
+    python supervisor.py                         # or: python main.py
+    python supervisor.py --config gate_box.json
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+from fileutil import DATA_DIR_ENV
+
+CONFIG_FILENAME = "supervisor.json"
+DEFAULT_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), CONFIG_FILENAME)
+
+DEFAULT_CONFIG = {
+    "data_dir": "parking_data",
+    "web": {"enabled": True, "port": 8501},
+    "api": {"enabled": True, "port": 8000},
+    "cameras": [{"name": "Camera_1", "source": 0}],
+    "services": [],           # extra {"name", "command", "requires", "probe", "cpus"} entries
+    "cpus": "auto",
+    "metrics": False,
+    "poll_interval": 0.5,
+    "health_interval": 5,
+    "unhealthy_after": 3,
+    "heartbeat_timeout": 30,
+    "backoff_initial": 1,
+    "backoff_max": 60,
+    "stable_after": 30,
+    "stop_timeout": 10,
+}
+
+
+def load_config(path=None):
+    """Merge ``path`` (or the repo-level ``supervisor.json``, if any) over ``DEFAULT_CONFIG``.
+
+    An explicit ``path`` that doesn't exist raises FileNotFoundError rather
+    than silently running some other configuration.
+    """
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if path is None and os.path.exists(DEFAULT_CONFIG_FILE):
+        path = DEFAULT_CONFIG_FILE
+    if path:
+        with open(path) as file:
+            overrides = json.load(file)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+    return config
+
+
+# ==== Probes ====
+def probe_http(url):
+    try:
+        with urlopen(url, timeout=2) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def probe_heartbeat(path, max_age):
+    try:
+        return time.time() - os.path.getmtime(path) <= max_age
+    except OSError:
+        return False
+
+
+# ==== Services ====
+class Service:
+    """One supervised process and its restart state."""
+
+    def __init__(self, name, command, requires=(), probe=None, cpus=None, oneshot=False, env=None):
+        self.name = name
+        self.command = command
+        self.requires = list(requires)
+        self.probe = probe or {}
+        self.cpus = cpus
+        self.oneshot = oneshot
+        self.env = env or {}
+        self.proc = None
+        self.state = "waiting"      # waiting, starting, ready, backoff, done, stopped
+        self.started_at = 0.0
+        self.next_start = 0.0
+        self.backoff = None
+        self.restarts = 0
+        self.failures = 0
+        self.last_check = 0.0
+
+    @property
+    def ready(self):
+        return self.state in ("ready", "done")
+
+    def check(self, config):
+        """Run the configured probe; services without one count as up while the process is."""
+        if "http" in self.probe:
+            return probe_http(self.probe["http"])
+        if "heartbeat" in self.probe:
+            return probe_heartbeat(self.probe["heartbeat"],
+                                   self.probe.get("max_age", config["heartbeat_timeout"]))
+        return time.monotonic() - self.started_at >= self.probe.get("grace", 1)
+
+    def status(self):
+        return {"state": self.state, "pid": self.proc.pid if self.proc else None,
+                "restarts": self.restarts, "cpus": self.cpus, "command": self.command}
+
+
+def assign_cpus(services, spec):
+    """Resolve each service's ``cpus`` setting to a CPU list (or None when pinning is unavailable)."""
+    if not hasattr(os, "sched_setaffinity"):
+        for service in services:
+            service.cpus = None
+        return
+    available = sorted(os.sched_getaffinity(0))
+    workers = [s for s in services if s.name.startswith("anpr-")]
+    if spec == "auto":
+        # Keep the first core for the app, API and friends; spread detectors over the rest
+        shared = available[:1] if len(available) > 1 else available
+        dedicated = available[1:] or available
+        for i, service in enumerate(workers):
+            if service.cpus is None:
+                service.cpus = [dedicated[i % len(dedicated)]]
+        for service in services:
+            if service.cpus is None and service not in workers:
+                service.cpus = shared
+    elif isinstance(spec, list):
+        for service in services:
+            if service.cpus is None:
+                service.cpus = spec
+    for service in services:
+        if service.cpus is not None:
+            service.cpus = [c for c in service.cpus if c in available] or None
+
+
+def build_services(config):
+    python = sys.executable
+    data_dir = config["data_dir"]
+    run_dir = os.path.join(data_dir, "run")
+    services = [Service(
+        "init", [python, "-c", f"from parking_db import ParkingDatabase; ParkingDatabase({data_dir!r})"],
+        oneshot=True,
+    )]
+    if config["web"].get("enabled", True):
+        port = config["web"]["port"]
+        services.append(Service(
+            "web", [python, "-m", "streamlit", "run", "entrypoint.py", "--server.headless", "true",
+                    "--server.port", str(port)],
+            requires=["init"], probe={"http": f"http://127.0.0.1:{port}/_stcore/health"},
+            cpus=config["web"].get("cpus"),
+        ))
+    if config["api"].get("enabled", True):
+        port = config["api"]["port"]
+        services.append(Service(
+            "api", [python, "api.py", "--data-dir", data_dir, "--port", str(port)],
+            requires=["init"], probe={"http": f"http://127.0.0.1:{port}/health"},
+            cpus=config["api"].get("cpus"),
+        ))
+    for camera in config["cameras"]:
+        heartbeat = os.path.join(run_dir, f"anpr-{camera['name']}.heartbeat")
+        command = [python, "plate_reader.py", "--headless", "--source", str(camera.get("source", 0)),
+                   "--camera-name", camera["name"], "--heartbeat", heartbeat, "--data-dir", data_dir]
+        if camera.get("live_port"):
+            command += ["--live-port", str(camera["live_port"]), "--live-fps", str(camera.get("live_fps", 5)),
+                        "--live-host", camera.get("live_host", "127.0.0.1")]
+        services.append(Service(
+            f"anpr-{camera['name']}", command,
+            requires=["init"], probe={"heartbeat": heartbeat, "max_age": camera.get("heartbeat_timeout")},
+            cpus=camera.get("cpus"),
+        ))
+    for extra in config["services"]:
+        services.append(Service(extra["name"], extra["command"], requires=extra.get("requires", ["init"]),
+                                probe=extra.get("probe"), cpus=extra.get("cpus"),
+                                oneshot=extra.get("oneshot", False), env=extra.get("env")))
+    for service in services:
+        # A probe entry with max_age None means "use the global timeout"
+        if service.probe.get("max_age") is None:
+            service.probe.pop("max_age", None)
+    assign_cpus(services, config["cpus"])
+    return services
+
+
+# ==== Supervisor ====
+class Supervisor:
+    def __init__(self, config):
+        self.config = config
+        self.services = build_services(config)
+        self.by_name = {s.name: s for s in self.services}
+        self.state_file = os.path.join(config["data_dir"], "run", "services.json")
+        self.stopping = False
+
+    def log(self, message):
+        print(f"[supervisor {time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+    # ---- Process control ----
+    def start(self, service):
+        env = dict(os.environ, **service.env)
+        # Every child, including the Streamlit app and extra services, shares the one data dir
+        env[DATA_DIR_ENV] = self.config["data_dir"]
+        if self.config["metrics"]:
+            env["SMARTPARK_METRICS"] = "1"
+        if service.cpus:
+            # Size inference thread pools to the pinned cores instead of the whole machine
+            threads = str(len(service.cpus))
+            env.setdefault("OMP_NUM_THREADS", threads)
+            env.setdefault("MKL_NUM_THREADS", threads)
+        if "heartbeat" in service.probe and os.path.exists(service.probe["heartbeat"]):
+            os.remove(service.probe["heartbeat"])
+
+        service.proc = subprocess.Popen(service.command, env=env, start_new_session=True)
+        if service.cpus:
+            try:
+                os.sched_setaffinity(service.proc.pid, service.cpus)
+            except OSError as exc:
+                self.log(f"{service.name}: could not pin to CPUs {service.cpus}: {exc}")
+        service.state = "starting"
+        service.started_at = time.monotonic()
+        service.failures = 0
+        self.log(f"started {service.name} (pid {service.proc.pid}"
+                 + (f", cpus {service.cpus})" if service.cpus else ")"))
+
+    def signal(self, service, sig):
+        try:
+            os.killpg(service.proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def schedule_restart(self, service, code):
+        now = time.monotonic()
+        if service.backoff is None or now - service.started_at >= self.config["stable_after"]:
+            service.backoff = self.config["backoff_initial"]
+        else:
+            service.backoff = min(service.backoff * 2, self.config["backoff_max"])
+        service.next_start = now + service.backoff
+        service.state = "backoff"
+        service.restarts += 1
+        self.log(f"{service.name} exited with {code}; restarting in {service.backoff:g} s")
+
+    # ---- Main loop ----
+    def tick(self):
+        now = time.monotonic()
+        for service in self.services:
+            if service.proc is not None and service.state in ("starting", "ready"):
+                code = service.proc.poll()
+                if code is not None:
+                    if service.oneshot and code == 0:
+                        service.state = "done"
+                        self.log(f"{service.name} completed")
+                    else:
+                        # Failed one-shots are retried too; their dependents keep waiting
+                        self.schedule_restart(service, code)
+                    continue
+
+            if service.state in ("waiting", "backoff"):
+                if service.state == "backoff" and now < service.next_start:
+                    continue
+                if all(self.by_name[r].ready for r in service.requires if r in self.by_name):
+                    self.start(service)
+            elif service.state == "starting" and not service.oneshot:
+                if service.check(self.config):
+                    service.state = "ready"
+                    service.last_check = now
+                    self.log(f"{service.name} is ready")
+            elif service.state == "ready" and now - service.last_check >= self.config["health_interval"]:
+                service.last_check = now
+                if service.check(self.config):
+                    service.failures = 0
+                else:
+                    service.failures += 1
+                    if service.failures >= self.config["unhealthy_after"]:
+                        self.log(f"{service.name} failed {service.failures} health checks; killing it")
+                        self.signal(service, signal.SIGKILL)
+        self.write_state()
+
+    def write_state(self):
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp = f"{self.state_file}.tmp"
+        with open(tmp, "w") as file:
+            json.dump({"pid": os.getpid(), "updated": time.time(),
+                       "ready": all(s.ready for s in self.services),
+                       "services": {s.name: s.status() for s in self.services}}, file, indent=2)
+        os.replace(tmp, self.state_file)
+
+    def run(self):
+        os.makedirs(os.path.join(self.config["data_dir"], "run"), exist_ok=True)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self._request_stop)
+        announced = False
+        while not self.stopping:
+            self.tick()
+            if not announced and all(s.ready for s in self.services):
+                announced = True
+                self.log("all services ready")
+            time.sleep(self.config["poll_interval"])
+        self.shutdown()
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def shutdown(self):
+        running = [s for s in reversed(self.services) if s.proc is not None and s.proc.poll() is None]
+        for service in running:
+            self.log(f"stopping {service.name}")
+            self.signal(service, signal.SIGTERM)
+        deadline = time.monotonic() + self.config["stop_timeout"]
+        for service in running:
+            try:
+                service.proc.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self.log(f"{service.name} did not stop in time; killing it")
+                self.signal(service, signal.SIGKILL)
+                service.proc.wait()
+        for service in self.services:
+            if service.state != "done":
+                service.state = "stopped"
+        self.write_state()
+        self.log("stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run and supervise the SmartPark services")
+    parser.add_argument("--config", help=f"JSON config (default: {CONFIG_FILENAME} next to this file)")
+    parser.add_argument("--no-web", action="store_true")
+    parser.add_argument("--no-api", action="store_true")
+    parser.add_argument("--no-cameras", action="store_true")
+    parser.add_argument("--metrics", action="store_true", help="enable SMARTPARK_METRICS in every service")
+    args = parser.parse_args()
+
+    try:
+        config = load_config(args.config)
+    except FileNotFoundError:
+        parser.error(f"config file not found: {args.config}")
+    if args.no_web:
+        config["web"]["enabled"] = False
+    if args.no_api:
+        config["api"]["enabled"] = False
+    if args.no_cameras:
+        config["cameras"] = []
+    if args.metrics:
+        config["metrics"] = True
+
+    # Child commands use paths relative to the repo
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    Supervisor(config).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import multiprocessing
+
+from user_db import LOGIN_POINTS, SIGNUP_POINTS, UserDatabase
+
+WORKERS = 6
+ROUNDS = 40
+COST = 5
+
+
+def _login_and_redeem(data_dir):
+    db = UserDatabase(data_dir, compact_every=3)
+    redeemed = 0
+    for _ in range(ROUNDS):
+        db.login("alice", "secret")
+        redeemed += db.redeem("alice", COST)
+    return redeemed
+
+
+def test_balance_exact_across_processes_with_frequent_compaction(tmp_path):
+    # Compacting every 3 entries replaces users.csv and the ledger constantly,
+    # so freed inode numbers get handed straight to the replacement files
+    data_dir = str(tmp_path)
+    UserDatabase(data_dir).signup("alice", "secret")
+
+    with multiprocessing.get_context("spawn").Pool(WORKERS) as pool:
+        redeemed = sum(pool.map(_login_and_redeem, [data_dir] * WORKERS))
+
+    assert redeemed == WORKERS * ROUNDS
+    expected = SIGNUP_POINTS + WORKERS * ROUNDS * LOGIN_POINTS - redeemed * COST
+    assert UserDatabase(data_dir).get_user_points("alice") == expected
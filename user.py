@@ -1,90 +1,13 @@
 import streamlit as st
-import pandas as pd
-import hashlib
-from datetime import datetime
-import os
 
-# === User DB Handler ===
-class UserDatabase:
-    def __init__(self, data_dir="parking_data"):
-        self.users_file = os.path.join(data_dir, "users.csv")
-        self.data_dir = data_dir
-        self.init_users()
-
-    def init_users(self):
-        os.makedirs(self.data_dir, exist_ok=True)
-        if not os.path.exists(self.users_file):
-            df = pd.DataFrame(columns=[
-                "username", "password_hash", "points", "created_at", "last_login"
-            ])
-            df.to_csv(self.users_file, index=False)
-
-    def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
-
-    def load_users(self):
-        return pd.read_csv(self.users_file)
-
-    def save_users(self, df):
-        df.to_csv(self.users_file, index=False)
-
-    def signup(self, username, password):
-        df = self.load_users()
-        if username in df['username'].values:
-            return False, "Username already exists."
-        new_user = pd.DataFrame([{
-            "username": username,
-            "password_hash": self.hash_password(password),
-            "points": 10,  # First login reward
-            "created_at": datetime.now().isoformat(),
-            "last_login": datetime.now().isoformat()
-        }])
-        df = pd.concat([df, new_user], ignore_index=True)
-        self.save_users(df)
-        return True, "Signup successful. You've earned 10 points!"
-
-    def login(self, username, password):
-        df = self.load_users()
-        hashed = self.hash_password(password)
-        user_row = df[(df['username'] == username) & (df['password_hash'] == hashed)]
-        if not user_row.empty:
-            index = user_row.index[0]
-            df.at[index, 'last_login'] = datetime.now().isoformat()
-            df.at[index, 'points'] += 10  # Login reward
-            self.save_users(df)
-            return True, df.loc[index].to_dict()
-        else:
-            return False, "Invalid username or password."
-
-    def add_points(self, username, points):
-        df = self.load_users()
-        if username in df['username'].values:
-            idx = df[df['username'] == username].index[0]
-            df.at[idx, 'points'] += points
-            self.save_users(df)
-
-    def get_user_points(self, username):
-        df = self.load_users()
-        if username in df['username'].values:
-            return int(df[df['username'] == username]['points'].values[0])
-        return 0
-
-    def redeem_reward(self, username, cost):
-        df = self.load_users()
-        if username in df['username'].values:
-            idx = df[df['username'] == username].index[0]
-            if int(df.at[idx, 'points']) >= cost:
-                df.at[idx, 'points'] -= cost
-                self.save_users(df)
-                return True
-        return False
+from user_db import UserDatabase, get_user_database
 
 
 # === UI Render ===
 def render_user_login_page():
     st.header("👤 User Portal")
 
-    db = UserDatabase()
+    db = get_user_database()
 
     if 'user_logged_in' not in st.session_state:
         st.session_state.user_logged_in = False
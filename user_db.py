@@ -0,0 +1,310 @@
+import csv
+import hashlib
+import io
+import os
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+
+import pandas as pd
+
+import metrics
+from fileutil import FileLock, TrackedFile, default_data_dir
+
+USER_COLUMNS = ["username", "password_hash", "points", "created_at", "last_login"]
+LEDGER_COLUMNS = ["username", "kind", "delta", "timestamp"]
+
+SIGNUP_POINTS = 10  # First login reward
+LOGIN_POINTS = 10   # Login reward
+
+
+# === User DB Handler ===
+class UserDatabase:
+    """User store with an in-memory username index and a points ledger.
+
+    ``users.csv`` holds each user's balance as of the last compaction. Every
+    point change (login reward, ``add_points``, redemption) is appended to
+    ``points_ledger.csv`` instead of rewriting the user table; once the ledger
+    reaches ``compact_every`` entries it is folded back into ``users.csv``.
+    Signups append a row to ``users.csv``.
+
+    Compaction writes the folded table to ``users.compacted.csv`` first and
+    then empties the ledger; that emptying is the commit point. A compaction
+    interrupted by a crash is finished (ledger already empty) or discarded
+    (ledger still full) by the next operation, so balances are never
+    replayed twice.
+
+    Lookups go through a dict keyed by username, so login and point
+    operations cost the same regardless of how many users exist. Writes take
+    a file lock, and before acting each operation replays whatever other
+    processes appended since it last looked, so ``redeem`` can't overspend
+    even when several app workers share the data directory.
+    """
+
+    def __init__(self, data_dir=None, compact_every=1000):
+        self.data_dir = data_dir = data_dir or default_data_dir()
+        self.users_file = os.path.join(data_dir, "users.csv")
+        self.ledger_file = os.path.join(data_dir, "points_ledger.csv")
+        self.compacted_file = os.path.join(data_dir, "users.compacted.csv")
+        self.lock_file = os.path.join(data_dir, "users.lock")
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._users = {}
+        self._sorted_names = []  # usernames in order, for paging
+        self._files = {path: TrackedFile(path) for path in (self.users_file, self.ledger_file)}
+        self._offsets = {}  # path -> bytes consumed
+        self._ledger_entries = 0
+        self.init_users()
+        with self._lock, self._file_lock():
+            self._recover()
+            self._reload()
+
+    def init_users(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        if not os.path.exists(self.users_file):
+            self._write_header(self.users_file, USER_COLUMNS)
+        if not os.path.exists(self.ledger_file):
+            self._write_header(self.ledger_file, LEDGER_COLUMNS)
+
+    def hash_password(self, password):
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    # ---- Storage ----
+    @staticmethod
+    def _write_header(path, columns):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", newline="") as file:
+            csv.writer(file).writerow(columns)
+        os.replace(tmp, path)
+
+    def _file_lock(self, exclusive=True):
+        return FileLock(self.lock_file, exclusive)
+
+    def _tail(self, path):
+        """Rows appended to ``path`` since the last call, or None if the file was replaced."""
+        offset = self._offsets[path]
+        with open(path, "rb") as file:
+            if not self._files[path].matches(file) or os.fstat(file.fileno()).st_size < offset:
+                return None
+            file.seek(offset)
+            data = file.read()
+        # Only consume complete lines; a concurrent writer may be mid-row
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return []
+        self._offsets[path] = offset + end
+        rows = list(csv.reader(io.StringIO(data[:end].decode())))
+        metrics.inc("smartpark_db_rows_read_total", len(rows), table=os.path.basename(path)[:-4])
+        return rows
+
+    def _reload(self):
+        self._users = {}
+        self._sorted_names = None
+        self._ledger_entries = 0
+        for path, tracked in self._files.items():
+            tracked.track()
+            self._offsets[path] = 0
+            rows = self._tail(path)[1:]  # skip header
+            self._apply(path, rows)
+        self._sorted_names = sorted(self._users)
+
+    def _refresh(self):
+        """Catch up with rows other processes appended; full reload after a compaction."""
+        if self._recover():
+            self._reload()
+            return
+        for path in (self.users_file, self.ledger_file):
+            rows = self._tail(path)
+            if rows is None:
+                self._reload()
+                return
+            self._apply(path, rows)
+
+    def _apply(self, path, rows):
+        if path == self.users_file:
+            for username, password_hash, points, created_at, last_login in rows:
+                if self._sorted_names is not None and username not in self._users:
+                    insort(self._sorted_names, username)
+                self._users[username] = {
+                    "username": username, "password_hash": password_hash,
+                    "points": int(float(points or 0)), "created_at": created_at,
+                    "last_login": last_login,
+                }
+        else:
+            for username, kind, delta, timestamp in rows:
+                user = self._users.get(username)
+                if user is None:
+                    continue
+                user["points"] += int(delta)
+                if kind == "login":
+                    user["last_login"] = timestamp
+            self._ledger_entries += len(rows)
+
+    def _append(self, path, row):
+        with open(path, "a", newline="") as file:
+            csv.writer(file).writerow(row)
+        metrics.inc("smartpark_db_rows_written_total", 1, table=os.path.basename(path)[:-4])
+        # Our own write is already reflected in memory; don't replay it
+        self._offsets[path] = os.path.getsize(path)
+        if path == self.ledger_file:
+            self._ledger_entries += 1
+
+    def _record(self, username, kind, delta):
+        timestamp = datetime.now().isoformat()
+        self._append(self.ledger_file, [username, kind, delta, timestamp])
+        user = self._users[username]
+        user["points"] += delta
+        if kind == "login":
+            user["last_login"] = timestamp
+        if self._ledger_entries >= self.compact_every:
+            self._compact()
+
+    def _replace_users(self, rows):
+        """Install ``rows`` as the user table and empty the ledger they include."""
+        tmp = f"{self.compacted_file}.tmp"
+        with open(tmp, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(USER_COLUMNS)
+            writer.writerows(rows)
+        os.replace(tmp, self.compacted_file)
+        # Commit point: from here on the compacted table is the truth (see _recover)
+        self._write_header(self.ledger_file, LEDGER_COLUMNS)
+        os.replace(self.compacted_file, self.users_file)
+        metrics.inc("smartpark_db_rows_written_total", len(rows), table="users")
+
+    def _recover(self):
+        """Finish or roll back a compaction cut short by a crash; True if there was one."""
+        if not os.path.exists(self.compacted_file):
+            return False
+        try:
+            with open(self.ledger_file, newline="") as file:
+                committed = len(file.readlines()) <= 1
+            if committed:
+                os.replace(self.compacted_file, self.users_file)
+            else:
+                os.remove(self.compacted_file)
+        except FileNotFoundError:
+            pass  # another process recovered first
+        return True
+
+    def _compact(self):
+        self._replace_users([[user[c] for c in USER_COLUMNS] for user in self._users.values()])
+        self._ledger_entries = 0
+        for path, tracked in self._files.items():
+            self._offsets[path] = tracked.track().st_size
+
+    @metrics.timed("smartpark_db_seconds", op="users.compact")
+    def compact(self):
+        """Fold the points ledger into ``users.csv`` balances."""
+        with self._lock, self._file_lock():
+            self._refresh()
+            self._compact()
+
+    # ---- Public API ----
+    @metrics.timed("smartpark_db_seconds", op="users.load_users")
+    def load_users(self):
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            return pd.DataFrame(list(self._users.values()), columns=USER_COLUMNS)
+
+    @metrics.timed("smartpark_db_seconds", op="users.query_users")
+    def query_users(self, prefix=None, after=None, limit=50):
+        """One page of users ordered by username.
+
+        ``prefix`` restricts to usernames starting with it; ``after`` is the
+        cursor (last username) returned by the previous page. Returns
+        ``(page DataFrame, next cursor or None)``.
+        """
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            names = self._sorted_names
+            lo = bisect_left(names, prefix) if prefix else 0
+            if after is not None:
+                lo = max(lo, bisect_left(names, after) + (1 if after in self._users else 0))
+            page = []
+            for name in names[lo:lo + limit + 1]:
+                if prefix and not name.startswith(prefix):
+                    break
+                page.append(name)
+            next_cursor = page[limit - 1] if len(page) > limit else None
+            rows = [self._users[name] for name in page[:limit]]
+            return pd.DataFrame(rows, columns=USER_COLUMNS), next_cursor
+
+    @metrics.timed("smartpark_db_seconds", op="users.save_users")
+    def save_users(self, df):
+        """Replace the whole user table (and discard the ledger it supersedes)."""
+        with self._lock, self._file_lock():
+            self._replace_users(df[USER_COLUMNS].fillna("").values.tolist())
+            self._reload()
+
+    @metrics.timed("smartpark_db_seconds", op="users.signup")
+    def signup(self, username, password):
+        with self._lock, self._file_lock():
+            self._refresh()
+            if username in self._users:
+                return False, "Username already exists."
+            now = datetime.now().isoformat()
+            user = {
+                "username": username,
+                "password_hash": self.hash_password(password),
+                "points": SIGNUP_POINTS,
+                "created_at": now,
+                "last_login": now
+            }
+            self._append(self.users_file, [user[c] for c in USER_COLUMNS])
+            self._users[username] = user
+            insort(self._sorted_names, username)
+        return True, "Signup successful. You've earned 10 points!"
+
+    @metrics.timed("smartpark_db_seconds", op="users.login")
+    def login(self, username, password):
+        hashed = self.hash_password(password)
+        with self._lock, self._file_lock():
+            self._refresh()
+            user = self._users.get(username)
+            if user is None or user["password_hash"] != hashed:
+                return False, "Invalid username or password."
+            self._record(username, "login", LOGIN_POINTS)
+            return True, dict(user)
+
+    @metrics.timed("smartpark_db_seconds", op="users.add_points")
+    def add_points(self, username, points):
+        with self._lock, self._file_lock():
+            self._refresh()
+            if username in self._users:
+                self._record(username, "add", int(points))
+
+    @metrics.timed("smartpark_db_seconds", op="users.get_user_points")
+    def get_user_points(self, username):
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            user = self._users.get(username)
+            return user["points"] if user else 0
+
+    @metrics.timed("smartpark_db_seconds", op="users.redeem")
+    def redeem(self, username, cost):
+        """Atomically deduct ``cost`` points; False if the user can't afford it."""
+        with self._lock, self._file_lock():
+            self._refresh()
+            user = self._users.get(username)
+            if user is None or user["points"] < cost:
+                return False
+            self._record(username, "redeem", -int(cost))
+            return True
+
+    @metrics.timed("smartpark_db_seconds", op="users.redeem_reward")
+    def redeem_reward(self, username, cost):
+        return self.redeem(username, cost)
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_user_database(data_dir=None):
+    """Process-wide shared ``UserDatabase`` so the index is built once, not per rerun."""
+    data_dir = data_dir or default_data_dir()
+    with _instances_lock:
+        if data_dir not in _instances:
+            _instances[data_dir] = UserDatabase(data_dir)
+        return _instances[data_dir]
@@ -1,132 +1,105 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
 import hashlib
 import os
 import random
 import string
 
-# ==== Database Class ====
-class ParkingDatabase:
-    def __init__(self, data_dir="parking_data"):
-        self.data_dir = data_dir
-        self.parking_spots_file = os.path.join(data_dir, "parking_spots.csv")
-        self.reservations_file = os.path.join(data_dir, "reservations_history.csv")
-        self.emergency_vehicles_file = os.path.join(data_dir, "emergency_vehicles.csv")
-        self.admin_users_file = os.path.join(data_dir, "admin_users.csv")
-        self.anpr_detections_file = os.path.join(data_dir, "anpr_detections.csv")
-        self.init_database()
-
-    def init_database(self):
-        os.makedirs(self.data_dir, exist_ok=True)
-        if not os.path.exists(self.parking_spots_file):
-            self.initialize_parking_spots()
-        if not os.path.exists(self.reservations_file):
-            pd.DataFrame(columns=[
-                'id', 'spot_id', 'plate_number', 'customer_name', 'customer_email',
-                'customer_phone', 'start_time', 'end_time', 'duration_minutes',
-                'status', 'created_at'
-            ]).to_csv(self.reservations_file, index=False)
-        if not os.path.exists(self.emergency_vehicles_file):
-            pd.DataFrame([{ "plate_number": "AMB001", "vehicle_type": "Ambulance",
-                "description": "City Hospital", "is_active": True,
-                "added_date": datetime.now().isoformat()
-            }]).to_csv(self.emergency_vehicles_file, index=False)
-        if not os.path.exists(self.admin_users_file):
-            hash_ = hashlib.sha256("admin123".encode()).hexdigest()
-            pd.DataFrame([{
-                "username": "admin", "password_hash": hash_, "email": "admin@smartpark.com",
-                "role": "super_admin", "created_at": datetime.now().isoformat(), "last_login": ""
-            }]).to_csv(self.admin_users_file, index=False)
-        if not os.path.exists(self.anpr_detections_file):
-            pd.DataFrame(columns=[
-                'id', 'plate_number', 'confidence', 'detection_time',
-                'camera_location', 'is_emergency', 'processed'
-            ]).to_csv(self.anpr_detections_file, index=False)
-
-    def initialize_parking_spots(self):
-        zones = {"A": "VIP", "B": "Regular", "S": "Staff", "E": "Emergency"}
-        spots = []
-        for zone in zones:
-            for i in range(1, 11):
-                spot_id = f"{zone}{i:02}"
-                spots.append({
-                    "spot_id": spot_id, "zone": zone, "status": "available",
-                    "plate_number": "", "reserved_by": "", "reserved_until": "",
-                    "last_updated": datetime.now().isoformat()
-                })
-        pd.DataFrame(spots).to_csv(self.parking_spots_file, index=False)
-
-    def get_parking_spots(self):
-        return pd.read_csv(self.parking_spots_file)
-
-    def get_reservations_history(self):
-        try:
-            return pd.read_csv(self.reservations_file)
-        except:
-            return pd.DataFrame()
-
-    def add_reservation(self, spot_id, plate_number, name, email, phone, duration):
-        start = datetime.now()
-        end = start + timedelta(minutes=duration)
-        df = self.get_reservations_history()
-        new_id = len(df) + 1
-        new_row = pd.DataFrame([{
-            "id": new_id, "spot_id": spot_id, "plate_number": plate_number, "customer_name": name,
-            "customer_email": email, "customer_phone": phone,
-            "start_time": start.isoformat(), "end_time": end.isoformat(),
-            "duration_minutes": duration, "status": "active", "created_at": datetime.now().isoformat()
-        }])
-        df = pd.concat([df, new_row])
-        df.to_csv(self.reservations_file, index=False)
-
-        # Update spot
-        self.update_spot_status(spot_id, 'reserved', plate_number, name, end.isoformat())
-
-    def update_spot_status(self, spot_id, status, plate_number='', reserved_by='', reserved_until=''):
-        df = pd.read_csv(self.parking_spots_file)
-        mask = df['spot_id'] == spot_id
-        df.loc[mask, 'status'] = status
-        df.loc[mask, 'plate_number'] = plate_number
-        df.loc[mask, 'reserved_by'] = reserved_by
-        df.loc[mask, 'reserved_until'] = reserved_until
-        df.loc[mask, 'last_updated'] = datetime.now().isoformat()
-        df.to_csv(self.parking_spots_file, index=False)
-
-    def clean_expired_reservations(self):
-        now = datetime.now()
-        df = self.get_reservations_history()
-        updated = False
-        for i, row in df.iterrows():
-            if row['status'] == 'active' and datetime.fromisoformat(row['end_time']) < now:
-                df.at[i, 'status'] = 'expired'
-                self.update_spot_status(
-                    spot_id=row['spot_id'],
-                    status='available',
-                    plate_number='',
-                    reserved_by='',
-                    reserved_until=''
-                )
-                updated = True
-        if updated:
-            df.to_csv(self.reservations_file, index=False)
-def update_spot_status(self, spot_id, status, plate_number='', reserved_by='', reserved_until=''):
-    df = pd.read_csv(self.parking_spots_file)
-    mask = df['spot_id'] == spot_id
-    df.loc[mask, 'status'] = status
-    df.loc[mask, 'plate_number'] = plate_number
-    df.loc[mask, 'reserved_by'] = reserved_by
-    df.loc[mask, 'reserved_until'] = reserved_until
-    df.loc[mask, 'last_updated'] = datetime.now().isoformat()
-    df.to_csv(self.parking_spots_file, index=False)
+from live_view import live_cameras
+from parking_db import ParkingDatabase, SpotUnavailable, apply_spot_changes
+
+LIVE_REFRESH_SECONDS = 2
+SPOT_EVENTS = ("spot", "spots_reset")
+
+
+# ==== Live refresh ====
+def follow_spot_changes(db, key, spots_df):
+    """Session copy of the spots frame, kept current from the change feed.
+
+    ``spots_df`` seeds the copy on first use. Later calls only apply the
+    events past the last sequence number seen, so polling costs nothing
+    while the lot is quiet. Returns ``(spots frame, events applied)``.
+    """
+    view = st.session_state.get(key)
+    if view is None:
+        view = st.session_state[key] = {"seq": db.changes.last_seq(), "spots": spots_df}
+        return view["spots"], []
+
+    events = db.changes.since(view["seq"])
+    if events is None:
+        # Fell behind the ring: start over from the store
+        view["seq"] = db.changes.last_seq()
+        view["spots"] = db.get_parking_spots()
+        return view["spots"], [None]
+    if events:
+        view["seq"] = events[-1]["seq"]
+        spots = apply_spot_changes(view["spots"], events)
+        view["spots"] = spots if spots is not None else db.get_parking_spots()
+    return view["spots"], events
+
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def watch_changes(db, key, types=SPOT_EVENTS):
+    """Rerun the page once the change feed has events of ``types`` past ``key``'s view.
+
+    Only this fragment runs on the timer, so a quiet lot costs one
+    ``since()`` per interval; the page body reruns only when there is
+    something new to show.
+    """
+    view = st.session_state.get(key)
+    if view is None:
+        return
+    events = db.changes.since(view["seq"])
+    if events is None or any(event["type"] in types for event in events):
+        st.rerun()
+    elif events:
+        # Nothing this view shows; skip past them
+        view["seq"] = events[-1]["seq"]
+
 
 # ==== UI ====
-def render_dashboard_page(spots_df, reservations_df):
-    st.header("🏠 SmartPark Dashboard")
+def render_dashboard_summary(db, spots_df):
     col1, col2 = st.columns(2)
     col1.metric("🅿️ Total Spots", len(spots_df))
-    col2.metric("📋 Total Reservations", len(reservations_df))
+    col2.metric("📋 Total Reservations", db.reservation_count())
     st.dataframe(spots_df.head())
+
+
+def render_dashboard_page(db, spots_df):
+    st.header("🏠 SmartPark Dashboard")
+    if st.toggle("🔴 Live refresh", key="dashboard_live_toggle"):
+        spots_df, _ = follow_spot_changes(db, "dashboard_live", spots_df)
+        # The summary also shows the reservation count
+        watch_changes(db, "dashboard_live", SPOT_EVENTS + ("reservation", "reservations_cleared"))
+    else:
+        st.session_state.pop("dashboard_live", None)
+    render_dashboard_summary(db, spots_df)
+    # Camera streams show plates and the gates; never to anonymous visitors
+    if st.session_state.get("admin_logged_in"):
+        render_camera_view(db)
+
+
+def render_camera_view(db):
+    """Embed a detector's MJPEG stream (admins only); the detector only renders while this is shown.
+
+    Detectors serve on localhost by default, so the embed works from the
+    app host itself; set a camera's ``live_host`` in the supervisor config
+    to reach it from other machines on a trusted network.
+    """
+    cameras = live_cameras(os.path.join(db.data_dir, "run", "live"))
+    if not cameras:
+        return
+    st.subheader("📹 Live Cameras")
+    col1, col2 = st.columns([1, 3])
+    camera = col1.selectbox("Camera", cameras, format_func=lambda c: c["camera"])
+    if not col2.toggle("Show stream", key="dashboard_camera_toggle"):
+        return
+    # The browser connects to the detector directly, on the host it reached the app through
+    headers = getattr(getattr(st, "context", None), "headers", None) or {}
+    host = headers.get("Host", "localhost").rsplit(":", 1)[0]
+    st.markdown(f'<img src="http://{host}:{camera["port"]}/stream.mjpg" style="width:100%" />',
+                unsafe_allow_html=True)
+
 def generate_random_plate():
     letters = ''.join(random.choices(string.ascii_uppercase, k=3))
     numbers = ''.join(random.choices(string.digits, k=4))
@@ -144,16 +117,21 @@ def render_reservation_page(spots_df, db):
 ####################################################################################################################################################
         detected_plate = generate_random_plate()  # Replace with actual ANPR logic important #######################################################
 ####################################################################################################################################################
-        db.add_reservation(
-            spot_id=selected_spot,
-            plate_number=detected_plate,
-            name="Auto-ANPR",
-            email="auto@smartpark.com",
-            phone="0000000000",
-            duration=60
-        )
-        st.success(f"✅ Reserved {selected_spot} for {detected_plate} using ANPR!")
-        st.rerun()
+        try:
+            db.add_reservation(
+                spot_id=selected_spot,
+                plate_number=detected_plate,
+                name="Auto-ANPR",
+                email="auto@smartpark.com",
+                phone="0000000000",
+                duration=60,
+                require_available=True
+            )
+        except SpotUnavailable as exc:
+            st.error(f"{exc}; please try again.")
+        else:
+            st.success(f"✅ Reserved {selected_spot} for {detected_plate} using ANPR!")
+            st.rerun()
 
     with st.form("reserve"):
         zone = st.selectbox("Zone", available['zone'].unique())
@@ -166,21 +144,24 @@ def render_reservation_page(spots_df, db):
         submit = st.form_submit_button("Reserve")
 
         if submit:
-            db.add_reservation(spot, plate, name, email, phone, duration)
-            st.success("Reservation created!")
-            st.rerun()
+            try:
+                db.add_reservation(spot, plate, name, email, phone, duration, require_available=True)
+            except SpotUnavailable as exc:
+                st.error(f"{exc}; please pick another spot.")
+            else:
+                st.success("Reservation created!")
+                st.rerun()
 
 
 
 
-def render_admin_login_page():
+def render_admin_login_page(db):
     st.header("🔐 Admin Login")
     with st.form("login"):
         user = st.text_input("Username")
         pwd = st.text_input("Password", type="password")
         submit = st.form_submit_button("Login")
         if submit:
-            db = ParkingDatabase()
             admin_df = pd.read_csv(db.admin_users_file)
             hashed = hashlib.sha256(pwd.encode()).hexdigest()
             if not admin_df[(admin_df['username'] == user) & (admin_df['password_hash'] == hashed)].empty: